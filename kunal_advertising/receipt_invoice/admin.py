@@ -1,25 +1,53 @@
+from datetime import timedelta
+
+from django.contrib import messages
+from django.contrib.admin.views.main import ChangeList
 from django.db.models import Sum
-from django.core.cache import cache
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.exceptions import PermissionDenied
 from django.forms.models import BaseInlineFormSet
-from django.urls import reverse
+from django.http import HttpResponseNotFound, HttpResponseRedirect, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
 from django.utils.safestring import mark_safe
+from nested_admin.formsets import NestedInlineFormSet
 from nested_admin.nested import NestedModelAdmin, NestedStackedInline
 from django.contrib import admin
 
 # Register your models here.
-from num2words import num2words
 from rangefilter.filter import DateRangeFilter
 
 from kunal_advertising.receipt_invoice.admin_filters import UserFilter
 from kunal_advertising.receipt_invoice.models import (
+    IST,
     ReceiptInvoice,
     PaperForAdvertisement,
     DatesForPaperAdvertisement,
+    ArchivedReceiptInvoice,
+)
+from kunal_advertising.receipt_invoice.caching import two_tier_cache
+from kunal_advertising.receipt_invoice.exports import iter_export_rows, stream_csv, stream_xlsx
+from kunal_advertising.receipt_invoice.exceptions import ConcurrentModificationError
+from kunal_advertising.receipt_invoice.forms import (
+    ChangedFormsOnlyFormSetMixin,
+    PublicationScheduleForm,
+    ReceiptInvoiceForm,
+    PaperForAdvertisementForm,
+)
+from kunal_advertising.receipt_invoice.schedule import get_publication_schedule
+from kunal_advertising.receipt_invoice.sms import send_messages
+from kunal_advertising.receipt_invoice.utils import get_amount_in_words
+from kunal_advertising.receipt_invoice.constants import (
+    CACHE_KEY_FOR_TOTAL_AMOUNT,
+    CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS,
+    CACHE_TIMEOUT_FOR_TOTAL_AMOUNT,
+    EXPORT_CONTENT_TYPES,
+    SMS_RESEND_BATCH_SIZE,
 )
-from kunal_advertising.receipt_invoice.constants import CACHE_KEY_FOR_TOTAL_AMOUNT, CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS
 
 
-class PaperForAdvertisementFormSet(BaseInlineFormSet):
+class PaperForAdvertisementFormSet(ChangedFormsOnlyFormSetMixin, BaseInlineFormSet):
     def save_existing(self, form, instance, commit=True):
         obj = super(PaperForAdvertisementFormSet, self).save_existing(form, instance, commit=True)
         # here you can add anything you need from the request
@@ -28,10 +56,44 @@ class PaperForAdvertisementFormSet(BaseInlineFormSet):
         return obj
 
 
+class DatesForPaperAdvertisementFormSet(ChangedFormsOnlyFormSetMixin, NestedInlineFormSet):
+    def save_existing_objects(self, initial_forms=None, commit=True):
+        # nested_admin fetches every existing object twice before checking whether its form has changed, so the
+        # unchanged ones are dropped first.
+        deleted_forms = self.deleted_forms
+        initial_forms = [form for form in initial_forms or [] if form.has_changed() or form in deleted_forms]
+        return super(DatesForPaperAdvertisementFormSet, self).save_existing_objects(initial_forms, commit)
+
+
+class ReceiptInvoiceChangeList(ChangeList):
+    load_results = True
+
+    def get_results(self, request):
+        # The export streams the whole filtered queryset, so it has no use for the count and the page of results.
+        if not self.load_results:
+            return
+
+        super(ReceiptInvoiceChangeList, self).get_results(request)
+        self.model_admin.cache_total_amounts(self.result_list)
+
+
+class ReceiptInvoiceExportChangeList(ReceiptInvoiceChangeList):
+    load_results = False
+
+
 class DatesForPaperAdvertisementInline(NestedStackedInline):
     model = DatesForPaperAdvertisement
     classes = ("collapse",)
     extra = 1
+    formset = DatesForPaperAdvertisementFormSet
+
+    def get_extra(self, request, obj=None, **kwargs):
+        # Papers which are already saved get their dates through "Add another", which keeps an empty date form per
+        # paper out of large receipts.
+        if obj and obj.pk:
+            return 0
+
+        return self.extra
 
 
 class PaperForAdvertisementInline(NestedStackedInline):
@@ -45,6 +107,7 @@ class PaperForAdvertisementInline(NestedStackedInline):
     ]
     classes = ("collapse",)
     extra = 1
+    form = PaperForAdvertisementForm
     formset = PaperForAdvertisementFormSet
 
     def get_readonly_fields(self, request, obj=None):
@@ -67,7 +130,7 @@ class ReceiptInvoiceAdmin(NestedModelAdmin):
         "id",
         "client_name",
         "phone_number",
-        "message_sent",
+        "message_status",
         "caption",
         "employee",
         "total_amount_charged",
@@ -77,14 +140,16 @@ class ReceiptInvoiceAdmin(NestedModelAdmin):
     list_filter = (
         ("created_at", DateRangeFilter),
         UserFilter,
-        "message_sent",
+        "message_status",
         "mode_of_payment",
     )
     search_fields = ("client_name",)
-    fields = ("client_name", "address", "bank_name", "branch", "mode_of_payment", "phone_number", "caption")
+    fields = ("client_name", "address", "bank_name", "branch", "mode_of_payment", "phone_number", "caption", "version")
+    form = ReceiptInvoiceForm
     inlines = [
         PaperForAdvertisementInline,
     ]
+    actions = ("resend_failed_messages",)
 
     class Media:
         js = ("receipt_invoice_admin/js/admin/custom_admin.js",)
@@ -98,22 +163,136 @@ class ReceiptInvoiceAdmin(NestedModelAdmin):
         url = reverse("receipt_invoice_preview")
         return mark_safe("<a href='{0}?receipt_id={1}'>Click Here</a>".format(url, obj.id))
 
+    generate_pdf.short_description = "Generate Bill Receipt"
+
     def total_amount_charged(self, obj):
-        cache_key_for_total_amount = CACHE_KEY_FOR_TOTAL_AMOUNT.format(client_id=obj.id)
-        cache_key_for_total_amount_in_words = CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS.format(client_id=obj.id)
-        total_amount = cache.get(cache_key_for_total_amount)
-        total_amount_in_words = cache.get(cache_key_for_total_amount_in_words)
+        return obj.get_total_amount_charged()
 
-        if not (total_amount and total_amount_in_words):
-            all_papers = obj.total_papers.all().aggregate(total_amount_charged=Sum("amount_charged"))
-            total_amount = all_papers.get("total_amount_charged")
-            if total_amount:
-                cache.set(cache_key_for_total_amount, total_amount, 60 * 24 * 365)
-                cache.set(cache_key_for_total_amount_in_words, num2words(total_amount).title(), 60 * 24 * 365)
+    def cache_total_amounts(self, receipt_invoices):
+        """
+        Loads the totals of a whole changelist page with one cache round trip and computes the missing ones with a
+        single grouped query, so that rendering each row is served from the in-process cache. The missing totals are
+        locked together, so workers rendering the page at the same time do not all recompute them.
+        """
+        receipt_ids_by_key = {}
+        for receipt_invoice in receipt_invoices:
+            receipt_ids_by_key[CACHE_KEY_FOR_TOTAL_AMOUNT.format(client_id=receipt_invoice.id)] = receipt_invoice.id
+            receipt_ids_by_key[CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS.format(client_id=receipt_invoice.id)] = (
+                receipt_invoice.id
+            )
 
-        return total_amount
+        def compute_total_amounts(cache_keys):
+            totals = (
+                PaperForAdvertisement.objects.filter(
+                    receipt_invoice_id__in={receipt_ids_by_key[cache_key] for cache_key in cache_keys}
+                )
+                .values("receipt_invoice_id")
+                .annotate(total_amount_charged=Sum("amount_charged"))
+            )
+            computed = {}
+            for total in totals:
+                if total["total_amount_charged"] is None:
+                    continue
 
-    generate_pdf.short_description = "Generate Bill Receipt"
+                receipt_id = total["receipt_invoice_id"]
+                computed[CACHE_KEY_FOR_TOTAL_AMOUNT.format(client_id=receipt_id)] = total["total_amount_charged"]
+                computed[CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS.format(client_id=receipt_id)] = get_amount_in_words(
+                    total["total_amount_charged"]
+                )
+
+            return {cache_key: computed.get(cache_key) for cache_key in cache_keys}
+
+        two_tier_cache.get_many_or_set(list(receipt_ids_by_key), compute_total_amounts, CACHE_TIMEOUT_FOR_TOTAL_AMOUNT)
+
+    def get_changelist(self, request, **kwargs):
+        if request.resolver_match and request.resolver_match.url_name == "receipt_invoice_receiptinvoice_export":
+            return ReceiptInvoiceExportChangeList
+
+        return ReceiptInvoiceChangeList
+
+    def get_urls(self):
+        urls = [
+            path(
+                "export/<str:export_format>/",
+                self.admin_site.admin_view(self.export_view),
+                name="receipt_invoice_receiptinvoice_export",
+            ),
+            path(
+                "schedule/",
+                self.admin_site.admin_view(self.publication_schedule_view),
+                name="receipt_invoice_receiptinvoice_schedule",
+            ),
+        ]
+        return urls + super(ReceiptInvoiceAdmin, self).get_urls()
+
+    def export_view(self, request, export_format):
+        """Streams the currently filtered changelist as a spreadsheet with one line per paper."""
+        if export_format not in EXPORT_CONTENT_TYPES:
+            return HttpResponseNotFound()
+
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+
+        try:
+            changelist = self.get_changelist_instance(request)
+        except IncorrectLookupParameters:
+            return HttpResponseRedirect(reverse("admin:receipt_invoice_receiptinvoice_changelist"))
+
+        rows = iter_export_rows(changelist.queryset)
+        response = StreamingHttpResponse(
+            stream_csv(rows) if export_format == "csv" else stream_xlsx(rows),
+            content_type=EXPORT_CONTENT_TYPES[export_format],
+        )
+        response["Content-Disposition"] = 'attachment; filename="receipts_{0}.{1}"'.format(
+            timezone.localdate().isoformat(), export_format
+        )
+        return response
+
+    def publication_schedule_view(self, request):
+        """Lists every advertisement scheduled for a date or date range, grouped by paper and edition."""
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+
+        tomorrow = timezone.localdate(timezone=IST) + timedelta(days=1)
+        form = PublicationScheduleForm(request.GET or {"start_date": tomorrow, "end_date": tomorrow})
+        schedule = []
+        if form.is_valid():
+            schedule = get_publication_schedule(form.cleaned_data["start_date"], form.cleaned_data["end_date"])
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title="Publication Schedule",
+            opts=self.model._meta,
+            form=form,
+            schedule=schedule,
+        )
+        return TemplateResponse(request, "admin/receipt_invoice/receiptinvoice/publication_schedule.html", context)
+
+    def resend_failed_messages(self, request, queryset):
+        # The messages are sent within the admin request, so a batch is capped to keep it well inside the worker
+        # timeout. The oldest attempts go first, so running the action again moves on to the rest.
+        failed = queryset.filter(message_status=ReceiptInvoice.MESSAGE_STATUS_FAILED)
+        failed_count = failed.count()
+        if not failed_count:
+            self.message_user(request, "None of the selected receipts has a failed message.", messages.WARNING)
+            return
+
+        receipt_invoices = list(
+            failed.select_related("created_by").order_by("message_attempted_at", "id")[:SMS_RESEND_BATCH_SIZE]
+        )
+        statuses = send_messages(receipt_invoices)
+        sent = statuses.count(ReceiptInvoice.MESSAGE_STATUS_SENT)
+        self.message_user(request, "Resent {0} messages, {1} failed again.".format(sent, len(statuses) - sent))
+        if failed_count > len(receipt_invoices):
+            self.message_user(
+                request,
+                "{0} more failed messages were not resent, please run the action again for them.".format(
+                    failed_count - len(receipt_invoices)
+                ),
+                messages.WARNING,
+            )
+
+    resend_failed_messages.short_description = "Resend failed messages"
 
     def get_readonly_fields(self, request, obj=None):
         if obj:
@@ -132,7 +311,53 @@ class ReceiptInvoiceAdmin(NestedModelAdmin):
         if not obj.pk:
             obj.created_by = request.user
 
+        # Saving an unchanged receipt would bump its version and make staff editing other papers of it conflict.
+        if change and not form.has_changed():
+            return
+
         super(ReceiptInvoiceAdmin, self).save_model(request, obj, form, change)
 
+    def save_related(self, request, form, formsets, change):
+        super(ReceiptInvoiceAdmin, self).save_related(request, form, formsets, change)
+        form.instance.refresh_total_amount_charged()
+
+    def changeform_view(self, request, object_id=None, form_url="", extra_context=None):
+        try:
+            return super(ReceiptInvoiceAdmin, self).changeform_view(request, object_id, form_url, extra_context)
+        except ConcurrentModificationError as exc:
+            # The admin transaction has been rolled back, so nothing of this submission was saved.
+            self.message_user(request, str(exc), messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+
+
+class ArchivedReceiptInvoiceAdmin(admin.ModelAdmin):
+    list_display = (
+        "receipt_id",
+        "client_name",
+        "financial_year",
+        "created_at",
+        "archived_at",
+        "generate_pdf",
+    )
+    list_filter = ("financial_year",)
+    search_fields = ("client_name",)
+    fields = ("receipt_id", "client_name", "financial_year", "created_at", "archived_at")
+
+    def generate_pdf(self, obj):
+        url = reverse("receipt_invoice_preview")
+        return mark_safe("<a href='{0}?receipt_id={1}'>Click Here</a>".format(url, obj.receipt_id))
+
+    generate_pdf.short_description = "Generate Bill Receipt"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 
 admin.site.register(ReceiptInvoice, ReceiptInvoiceAdmin)
+admin.site.register(ArchivedReceiptInvoice, ArchivedReceiptInvoiceAdmin)
@@ -0,0 +1,172 @@
+import json
+import logging
+import zlib
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from kunal_advertising.receipt_invoice.caching import two_tier_cache
+from kunal_advertising.receipt_invoice.constants import (
+    CACHE_KEY_FOR_TOTAL_AMOUNT,
+    CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS,
+    FINANCIAL_YEAR_START_MONTH,
+)
+from kunal_advertising.receipt_invoice.models import (
+    IST,
+    ArchivedReceiptInvoice,
+    DatesForPaperAdvertisement,
+    PaperForAdvertisement,
+    ReceiptInvoice,
+)
+from kunal_advertising.receipt_invoice.utils import get_amount_in_words
+
+logger = logging.getLogger(__name__)
+
+
+class ArchivedRelation(list):
+    """List of archived children which can be used in templates like a related manager."""
+
+    def all(self):
+        return self
+
+
+def get_financial_year(value):
+    value = timezone.localtime(value, IST) if timezone.is_aware(value) else value
+    return value.year if value.month >= FINANCIAL_YEAR_START_MONTH else value.year - 1
+
+
+def get_current_financial_year():
+    return get_financial_year(timezone.now())
+
+
+def get_financial_year_bounds(financial_year):
+    """Returns the aware [start, end) datetimes of the financial year starting in ``financial_year``."""
+    start = IST.localize(datetime(financial_year, FINANCIAL_YEAR_START_MONTH, 1))
+    end = IST.localize(datetime(financial_year + 1, FINANCIAL_YEAR_START_MONTH, 1))
+    return start, end
+
+
+def serialize_receipt_invoice(receipt_invoice):
+    papers = []
+    total_amount = Decimal(0)
+    for paper in receipt_invoice.total_papers.all():
+        total_amount += paper.amount_charged or 0
+        papers.append(
+            {
+                "id": paper.id,
+                "name": paper.name,
+                "edition": paper.edition,
+                "rate": paper.rate,
+                "extra_lines_or_words": paper.extra_lines_or_words,
+                "cost_of_one_extra_line_or_word": paper.cost_of_one_extra_line_or_word,
+                "amount_charged": paper.amount_charged,
+                "amount_charged_in_words": paper.amount_charged_in_words,
+                "created_at": paper.created_at,
+                "updated_at": paper.updated_at,
+                "all_dates": [{"id": advt_date.id, "date": advt_date.date} for advt_date in paper.all_dates.all()],
+            }
+        )
+
+    return {
+        "id": receipt_invoice.id,
+        "client_name": receipt_invoice.client_name,
+        "phone_number": receipt_invoice.phone_number,
+        "address": receipt_invoice.address,
+        "bank_name": receipt_invoice.bank_name,
+        "branch": receipt_invoice.branch,
+        "caption": receipt_invoice.caption,
+        "mode_of_payment": receipt_invoice.mode_of_payment,
+        "message_status": receipt_invoice.message_status,
+        "message_attempted_at": receipt_invoice.message_attempted_at,
+        "message_response": receipt_invoice.message_response,
+        "created_at": receipt_invoice.created_at,
+        "updated_at": receipt_invoice.updated_at,
+        "created_by": {
+            "id": receipt_invoice.created_by.id,
+            "first_name": receipt_invoice.created_by.first_name,
+            "last_name": receipt_invoice.created_by.last_name,
+        },
+        "total_papers": papers,
+        "total_amount_charged": total_amount,
+        "total_amount_charged_in_words": get_amount_in_words(total_amount),
+    }
+
+
+def compress_payload(data):
+    return zlib.compress(json.dumps(data, cls=DjangoJSONEncoder).encode("utf-8"), 9)
+
+
+def decompress_payload(payload):
+    return json.loads(zlib.decompress(bytes(payload)).decode("utf-8"))
+
+
+def load_archived_receipt_invoice(archived_receipt_invoice):
+    """
+    Rebuilds the archived receipt as plain objects exposing the same attributes as ReceiptInvoice, so that the
+    preview template can render it unchanged.
+    """
+    data = decompress_payload(archived_receipt_invoice.payload)
+    papers = ArchivedRelation()
+    for paper in data.pop("total_papers"):
+        paper["all_dates"] = ArchivedRelation(
+            SimpleNamespace(id=advt_date["id"], date=parse_date(advt_date["date"])) for advt_date in paper["all_dates"]
+        )
+        paper["amount_charged"] = Decimal(paper["amount_charged"]) if paper["amount_charged"] is not None else None
+        paper["created_at"] = parse_datetime(paper["created_at"]) if paper["created_at"] else None
+        paper["updated_at"] = parse_datetime(paper["updated_at"]) if paper["updated_at"] else None
+        papers.append(SimpleNamespace(**paper))
+
+    data["created_by"] = SimpleNamespace(**data["created_by"])
+    data["created_at"] = parse_datetime(data["created_at"]) if data["created_at"] else None
+    data["updated_at"] = parse_datetime(data["updated_at"]) if data["updated_at"] else None
+    data["message_attempted_at"] = (
+        parse_datetime(data["message_attempted_at"]) if data.get("message_attempted_at") else None
+    )
+    data["total_amount_charged"] = Decimal(data["total_amount_charged"])
+    return SimpleNamespace(total_papers=papers, **data)
+
+
+@transaction.atomic
+def archive_receipt_invoices(financial_year, receipt_ids):
+    """
+    Moves the given receipts along with their papers and dates into the archive store. The receipts are locked while
+    they are archived, and only the papers and dates which went into the archive are deleted, so anything added in
+    the meantime makes the delete fail instead of being lost.
+    """
+    receipt_invoices = list(
+        ReceiptInvoice.objects.filter(pk__in=receipt_ids)
+        .select_for_update(of=("self",))
+        .select_related("created_by")
+        .prefetch_related("total_papers__all_dates")
+    )
+    archived_receipt_invoices = [
+        ArchivedReceiptInvoice(
+            receipt_id=receipt_invoice.id,
+            financial_year=financial_year,
+            client_name=receipt_invoice.client_name,
+            created_at=receipt_invoice.created_at,
+            payload=compress_payload(serialize_receipt_invoice(receipt_invoice)),
+        )
+        for receipt_invoice in receipt_invoices
+    ]
+    ArchivedReceiptInvoice.objects.bulk_create(archived_receipt_invoices)
+
+    papers = [paper for receipt_invoice in receipt_invoices for paper in receipt_invoice.total_papers.all()]
+    DatesForPaperAdvertisement.objects.filter(
+        pk__in=[advt_date.id for paper in papers for advt_date in paper.all_dates.all()]
+    ).delete()
+    PaperForAdvertisement.objects.filter(pk__in=[paper.id for paper in papers]).delete()
+    receipt_ids = [receipt_invoice.id for receipt_invoice in receipt_invoices]
+    ReceiptInvoice.objects.filter(pk__in=receipt_ids).delete()
+
+    two_tier_cache.delete_many(
+        [CACHE_KEY_FOR_TOTAL_AMOUNT.format(client_id=receipt_id) for receipt_id in receipt_ids]
+        + [CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS.format(client_id=receipt_id) for receipt_id in receipt_ids]
+    )
+    logger.info("Archived {0} receipts of financial year {1}".format(len(archived_receipt_invoices), financial_year))
+    return len(archived_receipt_invoices)
@@ -0,0 +1,193 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+from kunal_advertising.receipt_invoice.constants import (
+    CACHE_KEY_FOR_LOCK,
+    CACHE_LOCK_TIMEOUT,
+    CACHE_LOCK_WAIT_ATTEMPTS,
+    CACHE_LOCK_WAIT_INTERVAL,
+    LOCAL_CACHE_MAX_ENTRIES,
+    LOCAL_CACHE_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class TwoTierCache:
+    """
+    In-process LRU cache with a short TTL in front of the django cache (memcached).
+
+    The local tier is per worker and is only invalidated by ``delete_many`` in the same worker, so its TTL bounds how
+    long other workers can serve a stale value.
+    """
+
+    def __init__(self, backend=cache, max_entries=LOCAL_CACHE_MAX_ENTRIES, local_timeout=LOCAL_CACHE_TIMEOUT):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.local_timeout = local_timeout
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"local_hits": 0, "remote_hits": 0, "misses": 0, "recomputes": 0}
+
+    def _incr(self, counter, count=1):
+        with self._lock:
+            self._stats[counter] += count
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return MISSING
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._local[key]
+                return MISSING
+
+            self._local.move_to_end(key)
+            self._stats["local_hits"] += 1
+            return value
+
+    def _set_local(self, key, value):
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.local_timeout, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def get(self, key, default=None):
+        value = self._get_local(key)
+        if value is not MISSING:
+            return value
+
+        value = self.backend.get(key, MISSING)
+        if value is MISSING:
+            self._incr("misses")
+            return default
+
+        self._incr("remote_hits")
+        self._set_local(key, value)
+        return value
+
+    def get_many(self, keys):
+        """Returns a dict of the keys found in either tier, fetching the ones not held locally in one round trip."""
+        found = {}
+        remote_keys = []
+        for key in keys:
+            value = self._get_local(key)
+            if value is MISSING:
+                remote_keys.append(key)
+            else:
+                found[key] = value
+
+        if remote_keys:
+            remote_values = self.backend.get_many(remote_keys)
+            for key, value in remote_values.items():
+                self._set_local(key, value)
+
+            self._incr("remote_hits", len(remote_values))
+            self._incr("misses", len(remote_keys) - len(remote_values))
+            found.update(remote_values)
+
+        return found
+
+    def set(self, key, value, timeout):
+        self.backend.set(key, value, timeout)
+        self._set_local(key, value)
+
+    def set_many(self, data, timeout):
+        self.backend.set_many(data, timeout)
+        for key, value in data.items():
+            self._set_local(key, value)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+        self.backend.delete_many(keys)
+
+    def get_or_set(self, key, compute, timeout):
+        """
+        Returns the cached value for ``key`` or computes it with single-flight locking, so that only one worker
+        recomputes an expired value while the others wait for it. Nothing is cached when ``compute`` returns None.
+        """
+        return self.get_many_or_set([key], lambda keys: {key: compute()}, timeout).get(key)
+
+    def get_many_or_set(self, keys, compute_missing, timeout):
+        """
+        Returns a dict of the cached values for ``keys``, computing the missing ones with single-flight locking.
+
+        The missing keys are locked together with one lock and ``compute_missing`` is called once with them,
+        returning a dict of their values, so that a whole changelist page is filled in a fixed number of round trips.
+        Another worker holding the same lock is waited for instead, and the keys are only computed here if it does not
+        finish in time. The cache is checked again just before writing, so that a value published in the meantime
+        (e.g. by a save) is kept instead of one computed before it. Keys whose value is None are left out of the
+        result and are not cached.
+        """
+        found = self.get_many(keys)
+        missing_keys = [key for key in keys if key not in found]
+        if not missing_keys:
+            return found
+
+        lock_key = CACHE_KEY_FOR_LOCK.format(key=self._get_lock_name(missing_keys))
+        lock_acquired = self.backend.add(lock_key, 1, CACHE_LOCK_TIMEOUT)
+        if not lock_acquired:
+            for _ in range(CACHE_LOCK_WAIT_ATTEMPTS):
+                time.sleep(CACHE_LOCK_WAIT_INTERVAL)
+                found.update(self._get_remote_many(missing_keys))
+                missing_keys = [key for key in missing_keys if key not in found]
+                # A released lock means that the other worker is done, whatever it did not cache is computed here.
+                if not missing_keys or self.backend.get(lock_key) is None:
+                    break
+            else:
+                logger.warning("Timed out waiting for {0} to be recomputed, computing them here".format(missing_keys))
+
+            if not missing_keys:
+                return found
+
+        try:
+            self._incr("recomputes", len(missing_keys))
+            computed = {key: value for key, value in compute_missing(missing_keys).items() if value is not None}
+            if computed:
+                published = self._get_remote_many(list(computed))
+                to_cache = {key: value for key, value in computed.items() if key not in published}
+                if to_cache:
+                    self.set_many(to_cache, timeout)
+
+                found.update(to_cache)
+                found.update(published)
+        finally:
+            if lock_acquired:
+                self.backend.delete(lock_key)
+
+        return found
+
+    def _get_remote_many(self, keys):
+        values = self.backend.get_many(keys)
+        for key, value in values.items():
+            self._set_local(key, value)
+
+        return values
+
+    @staticmethod
+    def _get_lock_name(keys):
+        if len(keys) == 1:
+            return keys[0]
+
+        # memcached keys are limited to 250 characters, so a batch is locked under a digest of its keys.
+        return "batch_{0}".format(hashlib.md5(",".join(sorted(keys)).encode("utf-8")).hexdigest())
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, local_entries=len(self._local))
+
+
+two_tier_cache = TwoTierCache()
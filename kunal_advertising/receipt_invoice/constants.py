@@ -5,4 +5,26 @@ NO_PAPER_FOUND = (
 NO_DATE_FOUND = "No date has been selected for paper {paper_name}. Please go the admin page and add date for this paper"
 CACHE_KEY_FOR_TOTAL_AMOUNT = "total_amount_for_{client_id}"
 CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS = "total_amount_in_words_for_{client_id}"
+CACHE_KEY_FOR_LOCK = "lock_for_{key}"
+CACHE_TIMEOUT_FOR_TOTAL_AMOUNT = 60 * 24 * 365
+CACHE_LOCK_TIMEOUT = 10  # in seconds
+CACHE_LOCK_WAIT_INTERVAL = 0.05  # in seconds
+CACHE_LOCK_WAIT_ATTEMPTS = 40
+LOCAL_CACHE_MAX_ENTRIES = 1024
+LOCAL_CACHE_TIMEOUT = 5  # in seconds
 TIME_12_HRS_FORMAT = "%d/%m/%Y %I:%M %p"
+FINANCIAL_YEAR_START_MONTH = 4  # financial year runs from 1st April to 31st March
+ARCHIVE_BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 500
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+PUBLICATION_SCHEDULE_MAX_DAYS = 92
+CONCURRENT_EDIT_ERROR = (
+    "{object_repr} has been changed by someone else since you opened it. Please reload the page and apply your "
+    "changes again."
+)
+SMS_REQUEST_TIMEOUT = 10  # in seconds
+SMS_RESEND_WORKERS = 8
+SMS_RESEND_BATCH_SIZE = 24  # at most 3 rounds of SMS_REQUEST_TIMEOUT per admin request
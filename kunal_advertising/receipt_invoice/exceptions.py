@@ -0,0 +1,2 @@
+class ConcurrentModificationError(Exception):
+    """Raised when an object is saved over a newer version than the one it was loaded with."""
@@ -0,0 +1,235 @@
+import csv
+import zipfile
+from decimal import Decimal
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from kunal_advertising.receipt_invoice.constants import EXPORT_CHUNK_SIZE
+from kunal_advertising.receipt_invoice.models import (
+    IST,
+    ReceiptInvoice,
+    PaperForAdvertisement,
+    DatesForPaperAdvertisement,
+)
+
+EXPORT_HEADERS = (
+    "Receipt ID",
+    "Date",
+    "Client Name",
+    "Phone Number",
+    "Employee",
+    "Mode of Payment",
+    "Message Status",
+    "Caption",
+    "Paper",
+    "Edition",
+    "Publication Dates",
+    "Rate",
+    "Extra Lines/Words",
+    "Cost Of One Extra Line/Word",
+    "Amount Charged",
+    "Receipt Total",
+)
+
+# Text starting with one of these is run as a formula by spreadsheet applications.
+FORMULA_PREFIXES = ("=", "+", "-", "@")
+
+XLSX_STATIC_PARTS = (
+    (
+        "[Content_Types].xml",
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        "</Types>",
+    ),
+    (
+        "_rels/.rels",
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        "</Relationships>",
+    ),
+    (
+        "xl/workbook.xml",
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Receipts" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>",
+    ),
+    (
+        "xl/_rels/workbook.xml.rels",
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        "</Relationships>",
+    ),
+)
+
+
+class Echo:
+    """File like object which hands back whatever is written to it, so that csv.writer can feed a generator."""
+
+    def write(self, value):
+        return value
+
+
+class StreamBuffer:
+    """Unseekable file like object collecting the bytes written by zipfile until they are streamed out."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_receipt_invoices(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields the receipts of ``queryset`` in its order, reading the ids through a server side cursor and loading
+    each chunk with its employee, papers and dates in a fixed number of queries. Receipts deleted or archived after
+    their id was read are skipped.
+    """
+    receipt_ids = queryset.values_list("pk", flat=True).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(receipt_ids, chunk_size))
+        if not chunk:
+            return
+
+        receipt_invoices = (
+            ReceiptInvoice.objects.filter(pk__in=chunk)
+            .select_related("created_by")
+            .prefetch_related(
+                Prefetch(
+                    "total_papers",
+                    queryset=PaperForAdvertisement.objects.order_by("id").prefetch_related(
+                        Prefetch("all_dates", queryset=DatesForPaperAdvertisement.objects.order_by("date"))
+                    ),
+                )
+            )
+            .in_bulk(chunk)
+        )
+        for receipt_id in chunk:
+            if receipt_id in receipt_invoices:
+                yield receipt_invoices[receipt_id]
+
+
+def iter_export_rows(queryset):
+    """Yields the header, one row per paper of every receipt and a final row with the grand total."""
+    yield EXPORT_HEADERS
+
+    grand_total = Decimal(0)
+    for receipt_invoice in iter_receipt_invoices(queryset):
+        papers = list(receipt_invoice.total_papers.all())
+        receipt_total = sum((paper.amount_charged or 0 for paper in papers), Decimal(0))
+        grand_total += receipt_total
+        created_at = receipt_invoice.created_at and timezone.localtime(receipt_invoice.created_at, IST)
+        receipt_columns = (
+            receipt_invoice.id,
+            created_at.strftime("%Y-%m-%d") if created_at else None,
+            receipt_invoice.client_name,
+            receipt_invoice.phone_number,
+            receipt_invoice.created_by.first_name + " " + receipt_invoice.created_by.last_name,
+            receipt_invoice.get_mode_of_payment_display(),
+            receipt_invoice.get_message_status_display(),
+            receipt_invoice.caption,
+        )
+
+        if not papers:
+            yield receipt_columns + (None,) * 7 + (receipt_total,)
+
+        for paper in papers:
+            yield receipt_columns + (
+                paper.name,
+                paper.edition,
+                ", ".join(advt_date.date.strftime("%d-%m-%Y") for advt_date in paper.all_dates.all()),
+                paper.rate,
+                paper.extra_lines_or_words,
+                paper.cost_of_one_extra_line_or_word,
+                paper.amount_charged,
+                receipt_total,
+            )
+
+    yield ("Total",) + (None,) * (len(EXPORT_HEADERS) - 2) + (grand_total,)
+
+
+def escape_formula(value):
+    """Quotes text which a spreadsheet would otherwise evaluate, as client names and captions are typed in by staff."""
+    value = str(value)
+    if value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+
+    return value
+
+
+def get_csv_cell(value):
+    if value is None:
+        return ""
+
+    if isinstance(value, (int, float, Decimal)):
+        return value
+
+    return escape_formula(value)
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow([get_csv_cell(value) for value in row])
+
+
+def get_xlsx_cell(value):
+    if value is None:
+        return "<c/>"
+
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return "<c><v>{0}</v></c>".format(value)
+
+    return '<c t="inlineStr"><is><t>{0}</t></is></c>'.format(escape(escape_formula(value)))
+
+
+def stream_xlsx(rows):
+    """
+    Writes a single sheet workbook with inline strings, handing the compressed bytes out as they are produced, so
+    the whole export is never held in memory.
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in XLSX_STATIC_PARTS:
+            workbook.writestr(name, content)
+
+        with workbook.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            for row in rows:
+                sheet.write("<row>{0}</row>".format("".join(get_xlsx_cell(value) for value in row)).encode("utf-8"))
+                data = buffer.pop()
+                if data:
+                    yield data
+
+            sheet.write(b"</sheetData></worksheet>")
+
+    yield buffer.pop()
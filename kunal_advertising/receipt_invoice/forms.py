@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.forms.utils import ErrorDict
+from nested_admin.formsets import mutable_querydict
+
+from kunal_advertising.receipt_invoice.constants import CONCURRENT_EDIT_ERROR, PUBLICATION_SCHEDULE_MAX_DAYS
+from kunal_advertising.receipt_invoice.models import ReceiptInvoice, PaperForAdvertisement
+
+
+class PublicationScheduleForm(forms.Form):
+    start_date = forms.DateField(widget=forms.DateInput(attrs={"type": "date"}))
+    end_date = forms.DateField(widget=forms.DateInput(attrs={"type": "date"}), required=False)
+
+    def clean(self):
+        cleaned_data = super(PublicationScheduleForm, self).clean()
+        start_date = cleaned_data.get("start_date")
+        if not start_date:
+            return cleaned_data
+
+        end_date = cleaned_data.get("end_date") or start_date
+        if end_date < start_date:
+            raise ValidationError("End date can not be before the start date.")
+
+        if end_date - start_date > timedelta(days=PUBLICATION_SCHEDULE_MAX_DAYS):
+            raise ValidationError("Please select a range of at most {0} days.".format(PUBLICATION_SCHEDULE_MAX_DAYS))
+
+        cleaned_data["end_date"] = end_date
+        return cleaned_data
+
+
+class VersionedModelForm(forms.ModelForm):
+    """
+    Posts back the version the object was rendered with, so that a change made over a newer version is reported
+    as a form error. The compare-and-swap in VersionedAbstractModel.save still guards the window up to the save.
+    """
+
+    version = forms.IntegerField(widget=forms.HiddenInput, min_value=0, required=False)
+
+    def clean_version(self):
+        version = self.cleaned_data.get("version")
+        return self.instance.version if version is None else version
+
+    def clean(self):
+        cleaned_data = super(VersionedModelForm, self).clean()
+        version = cleaned_data.get("version")
+        if self.instance.pk and version is not None and self.has_changed():
+            if not type(self.instance)._default_manager.filter(pk=self.instance.pk, version=version).exists():
+                raise ValidationError(CONCURRENT_EDIT_ERROR.format(object_repr=self.instance))
+
+        return cleaned_data
+
+
+class ReceiptInvoiceForm(VersionedModelForm):
+    class Meta:
+        model = ReceiptInvoice
+        fields = "__all__"
+
+
+class PaperForAdvertisementForm(VersionedModelForm):
+    class Meta:
+        model = PaperForAdvertisement
+        fields = "__all__"
+
+
+class ChangedFormsOnlyFormSetMixin:
+    """
+    The change form only posts the id of existing inline forms the user did not touch (see custom_admin.js). Such
+    forms are filled back from the database so that they render unchanged when the page is shown again, and their
+    validation is bypassed so they are neither validated nor saved. A form posting its delete checkbox counts as
+    touched, so that it is still deleted.
+    """
+
+    def _construct_form(self, i, **kwargs):
+        form = super(ChangedFormsOnlyFormSetMixin, self)._construct_form(i, **kwargs)
+        if self.is_bound and i < self.initial_form_count() and form.instance.pk and not self._is_posted(form):
+            self._restore_unchanged_form(form)
+
+        return form
+
+    def _is_posted(self, form):
+        skipped_fields = {self.model._meta.pk.name, self.fk.name}
+        return any(form.add_prefix(name) in form.data for name in form.fields if name not in skipped_fields)
+
+    def _restore_unchanged_form(self, form):
+        initial = {name: form.get_initial_for_field(field, name) for name, field in form.fields.items()}
+        with mutable_querydict(form.data):
+            for name, field in form.fields.items():
+                value = field.widget.format_value(initial[name])
+                if value is not None:
+                    form.data[form.add_prefix(name)] = value
+
+        form._errors = ErrorDict()
+        form.cleaned_data = initial
+        form.__dict__["changed_data"] = []
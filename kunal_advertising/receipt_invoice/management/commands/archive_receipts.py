@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from kunal_advertising.receipt_invoice.archive import (
+    archive_receipt_invoices,
+    get_current_financial_year,
+    get_financial_year_bounds,
+)
+from kunal_advertising.receipt_invoice.constants import ARCHIVE_BATCH_SIZE
+from kunal_advertising.receipt_invoice.models import ReceiptInvoice
+
+
+class Command(BaseCommand):
+    help = "Moves receipts of a closed financial year into the compressed, read only archive store."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "financial_year", type=int, help="Starting year of the financial year, e.g. 2020 for 2020-21"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="Receipts archived per transaction"
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only report how many receipts would be archived")
+
+    def handle(self, *args, **options):
+        financial_year = options["financial_year"]
+        if financial_year >= get_current_financial_year():
+            raise CommandError("Financial year {0}-{1} is not closed yet.".format(financial_year, financial_year + 1))
+
+        start, end = get_financial_year_bounds(financial_year)
+        queryset = ReceiptInvoice.objects.filter(created_at__gte=start, created_at__lt=end).order_by("pk")
+
+        if options["dry_run"]:
+            self.stdout.write("{0} receipts would be archived.".format(queryset.count()))
+            return
+
+        total_archived = 0
+        while True:
+            receipt_ids = list(queryset.values_list("pk", flat=True)[: options["batch_size"]])
+            if not receipt_ids:
+                break
+
+            total_archived += archive_receipt_invoices(financial_year, receipt_ids)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Archived {0} receipts of financial year {1}-{2}.".format(
+                    total_archived, financial_year, financial_year + 1
+                )
+            )
+        )
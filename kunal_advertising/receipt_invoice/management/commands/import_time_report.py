@@ -0,0 +1,51 @@
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+BOOT_SCRIPT = (
+    "from django.core.wsgi import get_wsgi_application; "
+    "get_wsgi_application(); "
+    "from django.urls import get_resolver; "
+    "get_resolver().url_patterns"
+)
+
+
+class Command(BaseCommand):
+    help = "Boots the WSGI application in a fresh interpreter with -X importtime and reports the slowest imports."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=25, help="Number of imports to report")
+        parser.add_argument(
+            "--sort",
+            choices=("cumulative", "self"),
+            default="cumulative",
+            help="Sort by the time including (cumulative) or excluding (self) nested imports",
+        )
+
+    def handle(self, *args, **options):
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", BOOT_SCRIPT],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        if process.returncode:
+            raise CommandError("Booting the application failed:\n{0}".format(process.stderr))
+
+        imports = []
+        for line in process.stderr.splitlines():
+            if not line.startswith("import time:") or "[us]" in line:
+                continue
+
+            self_time, cumulative_time, module = line[len("import time:") :].split("|")
+            imports.append((int(self_time), int(cumulative_time), module.rstrip()))
+
+        sort_index = 1 if options["sort"] == "cumulative" else 0
+        imports.sort(key=lambda imported: imported[sort_index], reverse=True)
+
+        total_time = sum(self_time for self_time, _, _ in imports)
+        self.stdout.write("{0} modules imported in {1:.1f} ms".format(len(imports), total_time / 1000))
+        self.stdout.write("{0:>12} {1:>12}  {2}".format("self [ms]", "cumul. [ms]", "module"))
+        for self_time, cumulative_time, module in imports[: options["limit"]]:
+            self.stdout.write("{0:>12.1f} {1:>12.1f}  {2}".format(self_time / 1000, cumulative_time / 1000, module))
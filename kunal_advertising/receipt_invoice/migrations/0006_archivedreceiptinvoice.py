@@ -0,0 +1,43 @@
+# Generated by Django 3.1.1 on 2026-10-19 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("receipt_invoice", "0005_auto_20201004_0856"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedReceiptInvoice",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("receipt_id", models.IntegerField(help_text="ID of the receipt before it was archived", unique=True)),
+                (
+                    "financial_year",
+                    models.PositiveSmallIntegerField(
+                        db_index=True,
+                        help_text="Starting year of the financial year of the receipt, e.g. 2020 for 2020-21",
+                    ),
+                ),
+                (
+                    "client_name",
+                    models.CharField(help_text="Client for which the invoice has been generated", max_length=200),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(blank=True, help_text="Time at which the receipt was cut", null=True),
+                ),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "payload",
+                    models.BinaryField(help_text="zlib compressed JSON of the receipt along with its papers and dates"),
+                ),
+            ],
+            options={
+                "ordering": ("-receipt_id",),
+            },
+        ),
+    ]
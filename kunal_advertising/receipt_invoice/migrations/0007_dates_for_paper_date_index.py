@@ -0,0 +1,17 @@
+# Generated by Django 3.1.1 on 2026-10-19 12:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("receipt_invoice", "0006_archivedreceiptinvoice"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="datesforpaperadvertisement",
+            index=models.Index(fields=["date", "paper_for_advertisement"], name="receipt_inv_date_paper_idx"),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.1.1 on 2026-10-19 12:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("receipt_invoice", "0007_dates_for_paper_date_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="paperforadvertisement",
+            name="version",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Incremented on every save to detect concurrent edits"
+            ),
+        ),
+        migrations.AddField(
+            model_name="receiptinvoice",
+            name="version",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Incremented on every save to detect concurrent edits"
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.1.1 on 2026-10-19 12:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("receipt_invoice", "0008_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="receiptinvoice",
+            name="message_attempted_at",
+            field=models.DateTimeField(
+                blank=True, help_text="Time of the last attempt to send the invoice message.", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="receiptinvoice",
+            name="message_status",
+            field=models.CharField(
+                choices=[("pending", "Pending"), ("sent", "Sent"), ("failed", "Failed")],
+                default="pending",
+                help_text="Delivery status of the invoice message.",
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="receiptinvoice",
+            name="message_response_json",
+            field=models.JSONField(
+                blank=True, help_text="Response sent by fast2sms api about message sent status", null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="receiptinvoice",
+            index=models.Index(fields=["message_status", "message_attempted_at"], name="receipt_inv_msg_status_idx"),
+        ),
+    ]
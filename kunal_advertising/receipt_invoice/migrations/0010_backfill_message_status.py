@@ -0,0 +1,50 @@
+# Generated by Django 3.1.1 on 2026-10-19 12:38
+
+import ast
+import json
+
+from django.db import migrations
+
+
+def parse_message_response(message_response):
+    """The old column holds str() of the dict returned by response.json(), which is a python literal, not JSON."""
+    if not message_response:
+        return None
+
+    for parse in (ast.literal_eval, json.loads):
+        try:
+            return parse(message_response)
+        except Exception:
+            # literal_eval also raises TypeError, MemoryError and RecursionError on odd input, none of which may stop
+            # the deploy as the old column is dropped right after this migration.
+            continue
+
+    return {"raw": message_response}
+
+
+def backfill_message_status(apps, schema_editor):
+    ReceiptInvoice = apps.get_model("receipt_invoice", "ReceiptInvoice")
+
+    for receipt_invoice in ReceiptInvoice.objects.exclude(message_sent__isnull=True).iterator():
+        message_response = parse_message_response(receipt_invoice.message_response)
+        # Earlier rows were marked as sent even when fast2sms answered with {"return": false, ...}.
+        accepted = not isinstance(message_response, dict) or message_response.get("return", True)
+        message_status = "sent" if receipt_invoice.message_sent and accepted else "failed"
+
+        ReceiptInvoice.objects.filter(pk=receipt_invoice.pk).update(
+            message_status=message_status,
+            message_response_json=message_response,
+            message_attempted_at=receipt_invoice.updated_at,
+        )
+
+
+def blank_migration(*args, **kwargs):
+    pass
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("receipt_invoice", "0009_receiptinvoice_message_status"),
+    ]
+
+    operations = [migrations.RunPython(backfill_message_status, blank_migration)]
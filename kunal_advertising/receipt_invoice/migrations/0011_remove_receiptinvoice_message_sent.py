@@ -0,0 +1,26 @@
+# Generated by Django 3.1.1 on 2026-10-19 12:38
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("receipt_invoice", "0010_backfill_message_status"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="receiptinvoice",
+            name="message_sent",
+        ),
+        migrations.RemoveField(
+            model_name="receiptinvoice",
+            name="message_response",
+        ),
+        migrations.RenameField(
+            model_name="receiptinvoice",
+            old_name="message_response_json",
+            new_name="message_response",
+        ),
+    ]
@@ -1,15 +1,13 @@
 import logging
 
-import requests
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from django.core.cache import cache
 from django.utils import timezone
-from num2words import num2words
 from pytz import timezone as pytz_timezone
 
 from django.core.exceptions import ValidationError
-from django.db import models, IntegrityError
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Sum
 from django.contrib.auth.models import User
 
 # Create your models here.
@@ -17,8 +15,14 @@ from kunal_advertising.receipt_invoice.constants import (
     RATE_OF_GST,
     CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS,
     CACHE_KEY_FOR_TOTAL_AMOUNT,
+    CACHE_TIMEOUT_FOR_TOTAL_AMOUNT,
+    CONCURRENT_EDIT_ERROR,
+    SMS_REQUEST_TIMEOUT,
     TIME_12_HRS_FORMAT,
 )
+from kunal_advertising.receipt_invoice.caching import two_tier_cache
+from kunal_advertising.receipt_invoice.exceptions import ConcurrentModificationError
+from kunal_advertising.receipt_invoice.utils import get_amount_in_words
 from kunal_advertising.receipt_invoice.validators import phone_number_validator
 
 logger = logging.getLogger(__name__)
@@ -34,7 +38,36 @@ class CreateUpdateAbstractModel(models.Model):
         abstract = True
 
 
-class ReceiptInvoice(CreateUpdateAbstractModel):
+class VersionedAbstractModel(models.Model):
+    version = models.PositiveIntegerField(default=0, help_text="Incremented on every save to detect concurrent edits")
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the object only if the row still has the version the object was loaded with (compare-and-swap), so
+        that concurrent edits fail with ConcurrentModificationError instead of silently overwriting each other.
+        """
+        if self._state.adding or kwargs.get("force_insert"):
+            super(VersionedAbstractModel, self).save(*args, **kwargs)
+            return
+
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = set(kwargs["update_fields"]) | {"version"}
+
+        with transaction.atomic(using=kwargs.get("using")):
+            updated = (
+                type(self)._default_manager.filter(pk=self.pk, version=self.version).update(version=F("version") + 1)
+            )
+            if not updated:
+                raise ConcurrentModificationError(CONCURRENT_EDIT_ERROR.format(object_repr=self))
+
+            self.version += 1
+            super(VersionedAbstractModel, self).save(*args, **kwargs)
+
+
+class ReceiptInvoice(CreateUpdateAbstractModel, VersionedAbstractModel):
     CHOICE_CASH = "cash"
     CHOICE_CHEQUE = "cheque"
 
@@ -43,8 +76,26 @@ class ReceiptInvoice(CreateUpdateAbstractModel):
         (CHOICE_CHEQUE, "Cheque"),
     )
 
+    MESSAGE_STATUS_PENDING = "pending"
+    MESSAGE_STATUS_SENT = "sent"
+    MESSAGE_STATUS_FAILED = "failed"
+
+    MESSAGE_STATUS_CHOICES = (
+        (MESSAGE_STATUS_PENDING, "Pending"),
+        (MESSAGE_STATUS_SENT, "Sent"),
+        (MESSAGE_STATUS_FAILED, "Failed"),
+    )
+
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, help_text="Employee who cut the receipt")
-    message_sent = models.BooleanField(null=True, help_text="If True, invoice message has been sent.")
+    message_status = models.CharField(
+        max_length=10,
+        default=MESSAGE_STATUS_PENDING,
+        choices=MESSAGE_STATUS_CHOICES,
+        help_text="Delivery status of the invoice message.",
+    )
+    message_attempted_at = models.DateTimeField(
+        null=True, blank=True, help_text="Time of the last attempt to send the invoice message."
+    )
     client_name = models.CharField(max_length=200, help_text="Client for which the invoice has been generated")
     phone_number = models.CharField(validators=[phone_number_validator], max_length=32)
     address = models.TextField(help_text="Address of the client", null=True, blank=True)
@@ -64,10 +115,15 @@ class ReceiptInvoice(CreateUpdateAbstractModel):
         choices=MODE_OF_PAYMENT_CHOICES,
         help_text="Mode of payment which client chose to do the payment.",
     )
-    message_response = models.CharField(
-        max_length=500, null=True, help_text="Response sent by fast2sms api about message sent status"
+    message_response = models.JSONField(
+        null=True, blank=True, help_text="Response sent by fast2sms api about message sent status"
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["message_status", "message_attempted_at"], name="receipt_inv_msg_status_idx"),
+        ]
+
     def __str__(self):
         return "Receipt ID:{0} Client Name:{1} Created By:{2}".format(
             self.id, self.client_name, self.created_by.first_name
@@ -75,17 +131,65 @@ class ReceiptInvoice(CreateUpdateAbstractModel):
 
     def save(self, *args, **kwargs):
         logger.info("Data for save is {0}".format(self.__dict__))
-        if "cache_invalidate" not in kwargs:
-            cache.delete(CACHE_KEY_FOR_TOTAL_AMOUNT.format(client_id=self.pk))
-            cache.delete(CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS.format(client_id=self.pk))
-        else:
-            kwargs.pop("cache_invalidate")
-
+        two_tier_cache.delete_many(
+            [
+                CACHE_KEY_FOR_TOTAL_AMOUNT.format(client_id=self.pk),
+                CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS.format(client_id=self.pk),
+            ]
+        )
         super(ReceiptInvoice, self).save(*args, **kwargs)
 
+    def aggregate_total_amount_charged(self):
+        return self.total_papers.aggregate(total_amount_charged=Sum("amount_charged")).get("total_amount_charged")
+
+    def refresh_total_amount_charged(self):
+        """
+        Recomputes the cached total while holding a row lock on the receipt, so that concurrent edits of its papers
+        recompute one after the other and the last one caches the total of every committed paper. The total is only
+        published once the surrounding transaction commits, so a rolled back edit never reaches the cache.
+        """
+        cache_keys = [
+            CACHE_KEY_FOR_TOTAL_AMOUNT.format(client_id=self.pk),
+            CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS.format(client_id=self.pk),
+        ]
+        with transaction.atomic():
+            ReceiptInvoice.objects.select_for_update().filter(pk=self.pk).values_list("pk", flat=True).get()
+            total_amount = self.aggregate_total_amount_charged()
+            if total_amount is None:
+                transaction.on_commit(lambda: two_tier_cache.delete_many(cache_keys))
+            else:
+                total_amounts = dict(zip(cache_keys, (total_amount, get_amount_in_words(total_amount))))
+                transaction.on_commit(lambda: two_tier_cache.set_many(total_amounts, CACHE_TIMEOUT_FOR_TOTAL_AMOUNT))
+
+        return total_amount
+
+    def get_total_amount_charged(self):
+        return two_tier_cache.get_or_set(
+            CACHE_KEY_FOR_TOTAL_AMOUNT.format(client_id=self.pk),
+            self.aggregate_total_amount_charged,
+            CACHE_TIMEOUT_FOR_TOTAL_AMOUNT,
+        )
+
+    def get_total_amount_charged_in_words(self):
+        cache_key_for_total_amount_in_words = CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS.format(client_id=self.pk)
+        total_amount_in_words = two_tier_cache.get(cache_key_for_total_amount_in_words)
+        if total_amount_in_words is None:
+            total_amount = self.get_total_amount_charged()
+            if total_amount is None:
+                return None
+
+            total_amount_in_words = get_amount_in_words(total_amount)
+            two_tier_cache.set(
+                cache_key_for_total_amount_in_words, total_amount_in_words, CACHE_TIMEOUT_FOR_TOTAL_AMOUNT
+            )
+
+        return total_amount_in_words
+
     def send_message_for_bill_receipt_created(self, total_amount_charged):
+        # requests is only needed by the few requests which send a message, so it is not imported at worker boot.
+        import requests
+
         current_time = timezone.now()
-        message_sent = None
         url = "https://www.fast2sms.com/dev/bulk"
 
         payload = "sender_id={}&message={}&language=english&route=p&numbers={}".format(
@@ -106,26 +210,39 @@ class ReceiptInvoice(CreateUpdateAbstractModel):
         }
 
         try:
-            response = requests.request("POST", url, data=payload, headers=headers)
+            response = requests.request("POST", url, data=payload, headers=headers, timeout=SMS_REQUEST_TIMEOUT)
+            message_response = response.json()
         except Exception as exc:
             logger.error(
                 "ERROR occurred while sending message {} for client Name: {} ID: {}".format(
                     exc, self.client_name, self.pk
                 )
             )
-            message_sent = False
+            self.message_status = self.MESSAGE_STATUS_FAILED
+            self.message_response = {"error": str(exc)}
         else:
-            message_sent = True
-            self.message_response = response.json()
-
-            logger.info("Message sent to mummy at {0}. Response payload is {1}".format(current_time, response.json()))
-        finally:
-            self.message_sent = message_sent
-            kwargs = {"cache_invalidate": False}
-            self.save(**kwargs)
+            # fast2sms answers with {"return": false, ...} when it did not accept the message.
+            if isinstance(message_response, dict) and message_response.get("return"):
+                self.message_status = self.MESSAGE_STATUS_SENT
+            else:
+                self.message_status = self.MESSAGE_STATUS_FAILED
+
+            self.message_response = message_response
+            logger.info("Message sent to mummy at {0}. Response payload is {1}".format(current_time, message_response))
+
+        self.message_attempted_at = current_time
+        # The message fields are not edited from the admin, so they are written without bumping the version to
+        # keep the message from conflicting with staff editing the receipt at the same time.
+        ReceiptInvoice.objects.filter(pk=self.pk).update(
+            message_status=self.message_status,
+            message_response=self.message_response,
+            message_attempted_at=self.message_attempted_at,
+            updated_at=timezone.now(),
+        )
+        return self.message_status
 
 
-class PaperForAdvertisement(CreateUpdateAbstractModel):
+class PaperForAdvertisement(CreateUpdateAbstractModel, VersionedAbstractModel):
     name = models.CharField(
         max_length=100,
         help_text="Name of the paper in which Advertisement has to be shown",
@@ -179,7 +296,7 @@ class PaperForAdvertisement(CreateUpdateAbstractModel):
             self.calculate_total_amount_charged()
         else:
             self.amount_charged = self.rate
-            self.amount_charged_in_words = num2words(self.amount_charged).title()
+            self.amount_charged_in_words = get_amount_in_words(self.amount_charged)
 
         super(PaperForAdvertisement, self).save(*args, **kwargs)
 
@@ -223,7 +340,7 @@ class PaperForAdvertisement(CreateUpdateAbstractModel):
     def calculate_total_amount_charged(self):
         extra_lines_or_words_cost = self.extra_lines_or_words * self.cost_of_one_extra_line_or_word
         self.amount_charged = self.rate + extra_lines_or_words_cost + ((RATE_OF_GST / 100) * extra_lines_or_words_cost)
-        self.amount_charged_in_words = num2words(self.amount_charged).title()
+        self.amount_charged_in_words = get_amount_in_words(self.amount_charged)
 
 
 class DatesForPaperAdvertisement(models.Model):
@@ -232,6 +349,11 @@ class DatesForPaperAdvertisement(models.Model):
         PaperForAdvertisement, on_delete=models.PROTECT, related_name="all_dates"
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["date", "paper_for_advertisement"], name="receipt_inv_date_paper_idx"),
+        ]
+
     def __str__(self):
         return "DatesForPaperAdvertisement ID:{0} Date For Publication:{1} For Paper:{2}".format(
             self.id, self.date, self.paper_for_advertisement.name
@@ -243,3 +365,28 @@ class DatesForPaperAdvertisement(models.Model):
             raise ValidationError("Please Enter the date.")
 
         super(DatesForPaperAdvertisement, self).save(*args, **kwargs)
+
+
+class ArchivedReceiptInvoice(models.Model):
+    receipt_id = models.IntegerField(unique=True, help_text="ID of the receipt before it was archived")
+    financial_year = models.PositiveSmallIntegerField(
+        db_index=True, help_text="Starting year of the financial year of the receipt, e.g. 2020 for 2020-21"
+    )
+    client_name = models.CharField(max_length=200, help_text="Client for which the invoice has been generated")
+    created_at = models.DateTimeField(null=True, blank=True, help_text="Time at which the receipt was cut")
+    archived_at = models.DateTimeField(auto_now_add=True)
+    payload = models.BinaryField(help_text="zlib compressed JSON of the receipt along with its papers and dates")
+
+    class Meta:
+        ordering = ("-receipt_id",)
+
+    def __str__(self):
+        return "Archived Receipt ID:{0} Client Name:{1} Financial Year:{2}".format(
+            self.receipt_id, self.client_name, self.financial_year
+        )
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValidationError("Archived receipts are read only.")
+
+        super(ArchivedReceiptInvoice, self).save(*args, **kwargs)
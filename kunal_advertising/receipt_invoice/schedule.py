@@ -0,0 +1,40 @@
+from itertools import groupby
+
+from kunal_advertising.receipt_invoice.models import DatesForPaperAdvertisement
+
+
+def get_publication_schedule(start_date, end_date):
+    """
+    Returns the advertisements scheduled between ``start_date`` and ``end_date`` (both inclusive) grouped as
+    ``[(date, [((paper name, edition), [DatesForPaperAdvertisement, ...]), ...]), ...]``.
+
+    The dates are looked up through the (date, paper_for_advertisement) index and the papers, receipts and
+    employees are joined in, so the whole schedule is loaded with a single query.
+    """
+    publication_dates = (
+        DatesForPaperAdvertisement.objects.filter(date__range=(start_date, end_date))
+        .select_related("paper_for_advertisement__receipt_invoice__created_by")
+        .order_by(
+            "date",
+            "paper_for_advertisement__name",
+            "paper_for_advertisement__edition",
+            "paper_for_advertisement__receipt_invoice_id",
+        )
+    )
+
+    return [
+        (
+            date,
+            [
+                (paper, list(advertisements))
+                for paper, advertisements in groupby(
+                    advertisements_for_date,
+                    key=lambda advt_date: (
+                        advt_date.paper_for_advertisement.name,
+                        advt_date.paper_for_advertisement.edition,
+                    ),
+                )
+            ],
+        )
+        for date, advertisements_for_date in groupby(publication_dates, key=lambda advt_date: advt_date.date)
+    ]
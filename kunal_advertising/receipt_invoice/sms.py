@@ -0,0 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+
+from kunal_advertising.receipt_invoice.constants import SMS_RESEND_WORKERS
+
+
+def send_message(receipt_invoice):
+    try:
+        return receipt_invoice.send_message_for_bill_receipt_created(receipt_invoice.get_total_amount_charged())
+    finally:
+        # Every worker thread opens its own connection, which would otherwise be left open once the pool is done.
+        connection.close()
+
+
+def send_messages(receipt_invoices):
+    """
+    Sends the invoice message of every receipt from a pool of threads, as each send mostly waits on the fast2sms
+    api. Returns the resulting message status of every receipt in the given order.
+    """
+    with ThreadPoolExecutor(max_workers=SMS_RESEND_WORKERS) as executor:
+        return list(executor.map(send_message, receipt_invoices))
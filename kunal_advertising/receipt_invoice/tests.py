@@ -1,3 +1,841 @@
-from django.test import TestCase
+import csv
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from kunal_advertising.receipt_invoice.admin import ReceiptInvoiceAdmin
+from kunal_advertising.receipt_invoice.archive import get_current_financial_year
+from kunal_advertising.receipt_invoice.caching import TwoTierCache, two_tier_cache
+from kunal_advertising.receipt_invoice.constants import (
+    CACHE_KEY_FOR_TOTAL_AMOUNT,
+    CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS,
+    CACHE_LOCK_WAIT_ATTEMPTS,
+    CACHE_TIMEOUT_FOR_TOTAL_AMOUNT,
+    CONCURRENT_EDIT_ERROR,
+    PUBLICATION_SCHEDULE_MAX_DAYS,
+)
+from kunal_advertising.receipt_invoice.exceptions import ConcurrentModificationError
+from kunal_advertising.receipt_invoice.exports import EXPORT_HEADERS, iter_receipt_invoices
+from kunal_advertising.receipt_invoice.forms import PublicationScheduleForm
+from kunal_advertising.receipt_invoice.models import (
+    IST,
+    ArchivedReceiptInvoice,
+    DatesForPaperAdvertisement,
+    ReceiptInvoice,
+    PaperForAdvertisement,
+)
+from kunal_advertising.receipt_invoice.schedule import get_publication_schedule
+
+
+class ConcurrentEditTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            "admin", "admin@example.com", "password", first_name="Admin", last_name="User"
+        )
+        self.receipt_invoice = ReceiptInvoice.objects.create(
+            created_by=self.user, client_name="Client", phone_number="+919999999999", caption="Caption"
+        )
+        self.paper = PaperForAdvertisement.objects.create(
+            name="Paper", edition="Delhi", receipt_invoice=self.receipt_invoice, rate=100
+        )
+        self.client.force_login(self.user)
+        self.url = reverse("admin:receipt_invoice_receiptinvoice_change", args=(self.receipt_invoice.pk,))
+
+    def get_post_data(self, **changes):
+        data = {
+            "caption": self.receipt_invoice.caption,
+            "bank_name": "",
+            "branch": "",
+            "mode_of_payment": self.receipt_invoice.mode_of_payment,
+            "version": self.receipt_invoice.version,
+            "total_papers-TOTAL_FORMS": 1,
+            "total_papers-INITIAL_FORMS": 1,
+            "total_papers-MIN_NUM_FORMS": 0,
+            "total_papers-MAX_NUM_FORMS": 1000,
+            "total_papers-0-id": self.paper.pk,
+            "total_papers-0-receipt_invoice": self.receipt_invoice.pk,
+            "total_papers-0-name": self.paper.name,
+            "total_papers-0-edition": self.paper.edition,
+            "total_papers-0-rate": self.paper.rate,
+            "total_papers-0-extra_lines_or_words": "",
+            "total_papers-0-cost_of_one_extra_line_or_word": "",
+            "total_papers-0-version": self.paper.version,
+            "total_papers-0-all_dates-TOTAL_FORMS": 0,
+            "total_papers-0-all_dates-INITIAL_FORMS": 0,
+            "total_papers-0-all_dates-MIN_NUM_FORMS": 0,
+            "total_papers-0-all_dates-MAX_NUM_FORMS": 1000,
+        }
+        data.update(changes)
+        return data
+
+    def test_save_over_a_newer_version_raises(self):
+        stale_receipt_invoice = ReceiptInvoice.objects.get(pk=self.receipt_invoice.pk)
+        self.receipt_invoice.caption = "First"
+        self.receipt_invoice.save()
+
+        stale_receipt_invoice.caption = "Second"
+        with self.assertRaises(ConcurrentModificationError):
+            stale_receipt_invoice.save()
+
+        self.receipt_invoice.refresh_from_db()
+        self.assertEqual(self.receipt_invoice.caption, "First")
+        self.assertEqual(self.receipt_invoice.version, 1)
+
+    def test_stale_version_is_a_form_error(self):
+        data = self.get_post_data(caption="Changed")
+        ReceiptInvoice.objects.filter(pk=self.receipt_invoice.pk).update(version=F("version") + 1)
+
+        response = self.client.post(self.url, data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            CONCURRENT_EDIT_ERROR.format(object_repr=self.receipt_invoice),
+            response.context["adminform"].form.non_field_errors(),
+        )
+        self.receipt_invoice.refresh_from_db()
+        self.assertEqual(self.receipt_invoice.caption, "Caption")
+
+    def test_conflict_after_validation_rolls_back_the_submission(self):
+        save_model = ReceiptInvoiceAdmin.save_model
+
+        def save_model_while_paper_is_edited(model_admin, request, obj, form, change):
+            save_model(model_admin, request, obj, form, change)
+            PaperForAdvertisement.objects.filter(pk=self.paper.pk).update(version=F("version") + 1)
+
+        with mock.patch.object(ReceiptInvoiceAdmin, "save_model", save_model_while_paper_is_edited):
+            response = self.client.post(
+                self.url, self.get_post_data(caption="Changed", **{"total_papers-0-rate": 200}), follow=True
+            )
+
+        self.assertRedirects(response, self.url)
+        self.assertIn(
+            CONCURRENT_EDIT_ERROR.format(object_repr=self.paper),
+            [str(message) for message in response.context["messages"]],
+        )
+        self.receipt_invoice.refresh_from_db()
+        self.paper.refresh_from_db()
+        self.assertEqual(self.receipt_invoice.caption, "Caption")
+        self.assertEqual(self.receipt_invoice.version, 0)
+        self.assertEqual(self.paper.rate, 100)
+
+    def test_unchanged_receipt_keeps_its_version(self):
+        response = self.client.post(self.url, self.get_post_data(**{"total_papers-0-rate": 200}))
+
+        self.assertEqual(response.status_code, 302)
+        self.receipt_invoice.refresh_from_db()
+        self.paper.refresh_from_db()
+        self.assertEqual(self.receipt_invoice.version, 0)
+        self.assertEqual(self.paper.version, 1)
+        self.assertEqual(self.paper.rate, 200)
+
+
+backfill_migration = import_module("kunal_advertising.receipt_invoice.migrations.0010_backfill_message_status")
+
+
+class ParseMessageResponseTestCase(TestCase):
+    def test_python_literal(self):
+        self.assertEqual(
+            backfill_migration.parse_message_response("{'return': True, 'request_id': 'abc'}"),
+            {"return": True, "request_id": "abc"},
+        )
+
+    def test_json(self):
+        self.assertEqual(backfill_migration.parse_message_response('{"return": false}'), {"return": False})
+
+    def test_unparseable_text_is_kept_raw(self):
+        for message_response in ("<html>Bad Gateway</html>", "{[1]: 2}"):
+            self.assertEqual(backfill_migration.parse_message_response(message_response), {"raw": message_response})
+
+    def test_empty(self):
+        self.assertIsNone(backfill_migration.parse_message_response(""))
+        self.assertIsNone(backfill_migration.parse_message_response(None))
+
+
+class BackfillMessageStatusTestCase(TransactionTestCase):
+    migrate_from = ("receipt_invoice", "0009_receiptinvoice_message_status")
+    migrate_to = ("receipt_invoice", "0010_backfill_message_status")
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.latest = executor.loader.graph.leaf_nodes()
+        executor.migrate([self.migrate_from])
+        apps = executor.loader.project_state([self.migrate_from]).apps
+
+        user = apps.get_model("auth", "User").objects.create(username="admin")
+        ReceiptInvoice = apps.get_model("receipt_invoice", "ReceiptInvoice")
+        self.receipt_ids = {}
+        for name, message_sent, message_response in (
+            ("accepted", True, "{'return': True, 'request_id': 'abc'}"),
+            ("rejected", True, "{'return': False, 'message': ['Invalid Authentication']}"),
+            ("errored", False, "HTTPSConnectionPool timed out"),
+            ("unhashable", True, "{[1]: 2}"),
+            ("never_sent", None, None),
+        ):
+            self.receipt_ids[name] = ReceiptInvoice.objects.create(
+                created_by=user,
+                client_name=name,
+                phone_number="+919999999999",
+                caption="Caption",
+                message_sent=message_sent,
+                message_response=message_response,
+            ).pk
+
+        executor = MigrationExecutor(connection)
+        executor.migrate([self.migrate_to])
+        self.apps = executor.loader.project_state([self.migrate_to]).apps
+
+    def tearDown(self):
+        MigrationExecutor(connection).migrate(self.latest)
+
+    def get_receipt_invoice(self, name):
+        return self.apps.get_model("receipt_invoice", "ReceiptInvoice").objects.get(pk=self.receipt_ids[name])
+
+    def test_backfill(self):
+        accepted = self.get_receipt_invoice("accepted")
+        self.assertEqual(accepted.message_status, "sent")
+        self.assertEqual(accepted.message_response_json, {"return": True, "request_id": "abc"})
+        self.assertEqual(accepted.message_attempted_at, accepted.updated_at)
+
+        rejected = self.get_receipt_invoice("rejected")
+        self.assertEqual(rejected.message_status, "failed")
+        self.assertEqual(rejected.message_response_json["return"], False)
+
+        errored = self.get_receipt_invoice("errored")
+        self.assertEqual(errored.message_status, "failed")
+        self.assertEqual(errored.message_response_json, {"raw": "HTTPSConnectionPool timed out"})
+
+        unhashable = self.get_receipt_invoice("unhashable")
+        self.assertEqual(unhashable.message_status, "sent")
+        self.assertEqual(unhashable.message_response_json, {"raw": "{[1]: 2}"})
+
+        never_sent = self.get_receipt_invoice("never_sent")
+        self.assertEqual(never_sent.message_status, "pending")
+        self.assertIsNone(never_sent.message_response_json)
+        self.assertIsNone(never_sent.message_attempted_at)
+
+
+@override_settings(
+    SENDER_ID="SENDER",
+    MESSAGE_CONTENT="{client_name} {user_name} {amount_charged} {time}",
+    RECIPIENT_NUMBER="9999999999",
+    FAST_SMS_API_KEY="key",
+)
+class SendMessageTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("admin", first_name="Admin")
+        self.receipt_invoice = ReceiptInvoice.objects.create(
+            created_by=user, client_name="Client", phone_number="+919999999999", caption="Caption"
+        )
+
+    def send_message(self, **request_mock_kwargs):
+        with mock.patch("requests.request", **request_mock_kwargs) as request:
+            message_status = self.receipt_invoice.send_message_for_bill_receipt_created(100)
+
+        self.receipt_invoice.refresh_from_db()
+        self.assertEqual(self.receipt_invoice.message_status, message_status)
+        self.assertIsNotNone(self.receipt_invoice.message_attempted_at)
+        return request
+
+    def test_accepted_message_is_sent(self):
+        request = self.send_message(**{"return_value.json.return_value": {"return": True, "request_id": "abc"}})
+
+        self.assertEqual(self.receipt_invoice.message_status, ReceiptInvoice.MESSAGE_STATUS_SENT)
+        self.assertEqual(self.receipt_invoice.message_response, {"return": True, "request_id": "abc"})
+        self.assertIn("Client Admin 100", request.call_args.kwargs["data"])
+        self.assertIn("timeout", request.call_args.kwargs)
+
+    def test_rejected_message_failed(self):
+        self.send_message(**{"return_value.json.return_value": {"return": False, "message": ["Invalid"]}})
+
+        self.assertEqual(self.receipt_invoice.message_status, ReceiptInvoice.MESSAGE_STATUS_FAILED)
+        self.assertEqual(self.receipt_invoice.message_response, {"return": False, "message": ["Invalid"]})
+
+    def test_request_error_failed(self):
+        self.send_message(side_effect=OSError("timed out"))
+
+        self.assertEqual(self.receipt_invoice.message_status, ReceiptInvoice.MESSAGE_STATUS_FAILED)
+        self.assertEqual(self.receipt_invoice.message_response, {"error": "timed out"})
+
+    def test_send_does_not_bump_the_version(self):
+        self.send_message(**{"return_value.json.return_value": {"return": True}})
+
+        self.assertEqual(self.receipt_invoice.version, 0)
+
+
+class ResendFailedMessagesTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            "admin", "admin@example.com", "password", first_name="Admin", last_name="User"
+        )
+        self.receipt_invoices = {}
+        for client_name, message_status, attempted_on in (
+            ("Newest", ReceiptInvoice.MESSAGE_STATUS_FAILED, 3),
+            ("Oldest", ReceiptInvoice.MESSAGE_STATUS_FAILED, 1),
+            ("Middle", ReceiptInvoice.MESSAGE_STATUS_FAILED, 2),
+            ("Sent", ReceiptInvoice.MESSAGE_STATUS_SENT, 1),
+            ("Pending", ReceiptInvoice.MESSAGE_STATUS_PENDING, None),
+        ):
+            self.receipt_invoices[client_name] = ReceiptInvoice.objects.create(
+                created_by=self.user,
+                client_name=client_name,
+                phone_number="+919999999999",
+                caption="Caption",
+                message_status=message_status,
+                message_attempted_at=IST.localize(datetime(2020, 6, attempted_on)) if attempted_on else None,
+            )
+
+        self.client.force_login(self.user)
+
+    def resend(self, client_names, statuses):
+        with mock.patch(
+            "kunal_advertising.receipt_invoice.admin.send_messages", return_value=statuses
+        ) as send_messages, mock.patch("kunal_advertising.receipt_invoice.admin.SMS_RESEND_BATCH_SIZE", 2):
+            response = self.client.post(
+                reverse("admin:receipt_invoice_receiptinvoice_changelist"),
+                {
+                    "action": "resend_failed_messages",
+                    "_selected_action": [self.receipt_invoices[client_name].pk for client_name in client_names],
+                },
+                follow=True,
+            )
+
+        return send_messages, [str(message) for message in response.context["messages"]]
+
+    def test_oldest_failed_messages_are_resent_in_capped_batches(self):
+        send_messages, messages = self.resend(
+            self.receipt_invoices, [ReceiptInvoice.MESSAGE_STATUS_SENT, ReceiptInvoice.MESSAGE_STATUS_FAILED]
+        )
+
+        (receipt_invoices,), kwargs = send_messages.call_args
+        self.assertEqual([receipt_invoice.client_name for receipt_invoice in receipt_invoices], ["Oldest", "Middle"])
+        self.assertEqual(
+            messages,
+            [
+                "Resent 1 messages, 1 failed again.",
+                "1 more failed messages were not resent, please run the action again for them.",
+            ],
+        )
+
+    def test_batch_within_the_cap(self):
+        send_messages, messages = self.resend(["Newest", "Sent"], [ReceiptInvoice.MESSAGE_STATUS_SENT])
+
+        (receipt_invoices,), kwargs = send_messages.call_args
+        self.assertEqual([receipt_invoice.client_name for receipt_invoice in receipt_invoices], ["Newest"])
+        self.assertEqual(messages, ["Resent 1 messages, 0 failed again."])
+
+    def test_no_failed_message_selected(self):
+        send_messages, messages = self.resend(["Sent", "Pending"], [])
+
+        send_messages.assert_not_called()
+        self.assertEqual(messages, ["None of the selected receipts has a failed message."])
+
+
+class ArchiveReceiptsTestCase(TestCase):
+    def setUp(self):
+        self.financial_year = get_current_financial_year() - 1
+        self.user = User.objects.create_superuser(
+            "admin", "admin@example.com", "password", first_name="Admin", last_name="User"
+        )
+        self.receipt_invoice = ReceiptInvoice.objects.create(
+            created_by=self.user, client_name="Client", phone_number="+919999999999", caption="Caption"
+        )
+        ReceiptInvoice.objects.filter(pk=self.receipt_invoice.pk).update(
+            created_at=IST.localize(datetime(self.financial_year, 6, 1))
+        )
+        for name, rate in (("Paper", 100), ("Other Paper", 50)):
+            paper = PaperForAdvertisement.objects.create(
+                name=name, edition="Delhi", receipt_invoice=self.receipt_invoice, rate=rate
+            )
+            DatesForPaperAdvertisement.objects.create(
+                date=date(self.financial_year, 6, 2), paper_for_advertisement=paper
+            )
+
+        self.current_receipt_invoice = ReceiptInvoice.objects.create(
+            created_by=self.user, client_name="Current", phone_number="+919999999999", caption="Caption"
+        )
+        self.cache_keys = [
+            CACHE_KEY_FOR_TOTAL_AMOUNT.format(client_id=self.receipt_invoice.pk),
+            CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS.format(client_id=self.receipt_invoice.pk),
+        ]
+
+    def archive(self, *args):
+        stdout = StringIO()
+        call_command("archive_receipts", self.financial_year, *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_archive(self):
+        two_tier_cache.set_many(
+            dict(zip(self.cache_keys, (150, "One Hundred And Fifty"))), CACHE_TIMEOUT_FOR_TOTAL_AMOUNT
+        )
+
+        self.assertIn("Archived 1 receipts", self.archive())
+
+        self.assertFalse(ReceiptInvoice.objects.filter(pk=self.receipt_invoice.pk).exists())
+        self.assertFalse(PaperForAdvertisement.objects.exists())
+        self.assertFalse(DatesForPaperAdvertisement.objects.exists())
+        self.assertTrue(ReceiptInvoice.objects.filter(pk=self.current_receipt_invoice.pk).exists())
+        archived_receipt_invoice = ArchivedReceiptInvoice.objects.get()
+        self.assertEqual(archived_receipt_invoice.receipt_id, self.receipt_invoice.pk)
+        self.assertEqual(archived_receipt_invoice.financial_year, self.financial_year)
+        self.assertEqual(two_tier_cache.get_many(self.cache_keys), {})
+
+    def test_preview_of_archived_receipt(self):
+        self.archive()
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("receipt_invoice_preview"), {"receipt_id": self.receipt_invoice.pk})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["total_amount_charged"], 150)
+        self.assertEqual(response.context["total_amount_charged_in_words"], "One Hundred And Fifty")
+        self.assertContains(response, "Other Paper")
+        self.assertContains(response, "One Hundred And Fifty")
+
+    def test_current_financial_year_is_refused(self):
+        with self.assertRaises(CommandError):
+            call_command("archive_receipts", get_current_financial_year(), stdout=StringIO())
+
+        self.assertFalse(ArchivedReceiptInvoice.objects.exists())
+
+    def test_dry_run(self):
+        self.assertIn("1 receipts would be archived", self.archive("--dry-run"))
+
+        self.assertTrue(ReceiptInvoice.objects.filter(pk=self.receipt_invoice.pk).exists())
+        self.assertFalse(ArchivedReceiptInvoice.objects.exists())
+
+
+class TwoTierCacheTestCase(TestCase):
+    def setUp(self):
+        backend = LocMemCache("two-tier-cache-tests", {})
+        backend.clear()
+        self.backend = mock.Mock(wraps=backend)
+        self.cache = TwoTierCache(backend=self.backend, max_entries=2, local_timeout=5)
+        self.computed_keys = []
+
+    def compute_missing(self, keys):
+        self.computed_keys.append(list(keys))
+        return {key: key.upper() for key in keys}
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set("a", 1, 60)
+        self.cache.set("b", 2, 60)
+        self.cache.get("a")
+        self.cache.set("c", 3, 60)
+        self.backend.delete_many(["a", "b", "c"])
+
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertEqual(self.cache.get("c"), 3)
+        self.assertIsNone(self.cache.get("b"))
+
+    def test_local_entry_expires(self):
+        with mock.patch("kunal_advertising.receipt_invoice.caching.time.monotonic", return_value=100):
+            self.cache.set("a", 1, 60)
+
+        self.backend.delete("a")
+        with mock.patch("kunal_advertising.receipt_invoice.caching.time.monotonic", return_value=104):
+            self.assertEqual(self.cache.get("a"), 1)
+
+        with mock.patch("kunal_advertising.receipt_invoice.caching.time.monotonic", return_value=106):
+            self.assertIsNone(self.cache.get("a"))
+
+    def test_counters(self):
+        self.cache.set("a", 1, 60)
+        self.backend.set("b", 2, 60)
+
+        self.assertEqual(self.cache.get_many(["a", "b", "c"]), {"a": 1, "b": 2})
+        self.assertEqual(
+            self.cache.stats(), {"local_hits": 1, "remote_hits": 1, "misses": 1, "recomputes": 0, "local_entries": 2}
+        )
+
+    def test_missing_keys_are_filled_in_one_batch(self):
+        keys = ["key_{0}".format(i) for i in range(100)]
+
+        self.assertEqual(self.cache.get_many_or_set(keys, self.compute_missing, 60), {key: key.upper() for key in keys})
+
+        self.assertEqual(self.computed_keys, [keys])
+        self.assertEqual(self.backend.add.call_count, 1)
+        self.assertEqual(self.backend.set_many.call_count, 1)
+        self.assertEqual(self.backend.get_many.call_count, 2)
+        self.assertEqual(self.backend.delete.call_count, 1)
+        self.assertEqual(self.backend.get("key_0"), "KEY_0")
+
+    def test_none_is_not_cached(self):
+        self.assertIsNone(self.cache.get_or_set("a", lambda: None, 60))
+        self.assertIsNone(self.backend.get("a"))
+
+    def test_value_published_while_computing_is_kept(self):
+        def compute_missing(keys):
+            self.backend.set("a", "published", 60)
+            return {"a": "computed", "b": "computed"}
+
+        self.assertEqual(
+            self.cache.get_many_or_set(["a", "b"], compute_missing, 60), {"a": "published", "b": "computed"}
+        )
+        self.assertEqual(self.backend.get("a"), "published")
+        self.assertEqual(self.cache.get("a"), "published")
+
+    @mock.patch("kunal_advertising.receipt_invoice.caching.time.sleep")
+    def test_waits_for_the_worker_holding_the_lock(self, sleep):
+        self.backend.add("lock_for_a", 1, 60)
+        sleep.side_effect = lambda interval: self.backend.set("a", "from other worker", 60)
+
+        self.assertEqual(self.cache.get_or_set("a", lambda: "computed", 60), "from other worker")
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(self.cache.stats()["recomputes"], 0)
+
+    @mock.patch("kunal_advertising.receipt_invoice.caching.time.sleep")
+    def test_computes_once_the_lock_is_released_without_a_value(self, sleep):
+        self.backend.add("lock_for_a", 1, 60)
+        sleep.side_effect = lambda interval: self.backend.delete("lock_for_a")
+
+        self.assertEqual(self.cache.get_or_set("a", lambda: "computed", 60), "computed")
+        self.assertEqual(sleep.call_count, 1)
+
+    @mock.patch("kunal_advertising.receipt_invoice.caching.time.sleep")
+    def test_computes_after_waiting_too_long(self, sleep):
+        self.backend.add("lock_for_a", 1, 60)
+
+        with self.assertLogs("kunal_advertising.receipt_invoice.caching", "WARNING"):
+            self.assertEqual(self.cache.get_or_set("a", lambda: "computed", 60), "computed")
+
+        self.assertEqual(sleep.call_count, CACHE_LOCK_WAIT_ATTEMPTS)
+        # The lock belongs to the other worker, so it is left alone.
+        self.assertEqual(self.backend.get("lock_for_a"), 1)
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            "admin", "admin@example.com", "password", first_name="Admin", last_name="User"
+        )
+        self.failed_receipt_invoice = ReceiptInvoice.objects.create(
+            created_by=self.user,
+            client_name="=cmd|' /C calc'!A0",
+            phone_number="+919999999999",
+            caption="Caption",
+            message_status=ReceiptInvoice.MESSAGE_STATUS_FAILED,
+        )
+        for name, rate in (("Paper", 100), ("Other Paper", 50)):
+            paper = PaperForAdvertisement.objects.create(
+                name=name, edition="Delhi", receipt_invoice=self.failed_receipt_invoice, rate=rate
+            )
+            DatesForPaperAdvertisement.objects.create(date=date(2020, 6, 2), paper_for_advertisement=paper)
+
+        self.sent_receipt_invoice = ReceiptInvoice.objects.create(
+            created_by=self.user,
+            client_name="Client",
+            phone_number="+919999999999",
+            caption="Caption",
+            message_status=ReceiptInvoice.MESSAGE_STATUS_SENT,
+        )
+        PaperForAdvertisement.objects.create(
+            name="Paper", edition="Delhi", receipt_invoice=self.sent_receipt_invoice, rate=70
+        )
+        self.client.force_login(self.user)
+
+    def export(self, export_format, **params):
+        return self.client.get(reverse("admin:receipt_invoice_receiptinvoice_export", args=(export_format,)), params)
+
+    def test_csv_uses_the_changelist_filters(self):
+        response = self.export("csv", message_status__exact=ReceiptInvoice.MESSAGE_STATUS_FAILED)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.reader(StringIO(b"".join(response.streaming_content).decode("utf-8"))))
+        self.assertEqual(tuple(rows[0]), EXPORT_HEADERS)
+        self.assertEqual([row[0] for row in rows[1:3]], [str(self.failed_receipt_invoice.pk)] * 2)
+        self.assertEqual([row[8] for row in rows[1:3]], ["Paper", "Other Paper"])
+        self.assertEqual(Decimal(rows[1][-1]), 150)
+        self.assertEqual(rows[3][0], "Total")
+        self.assertEqual(Decimal(rows[3][-1]), 150)
+        self.assertEqual(len(rows), 4)
+
+    def test_formulas_are_escaped(self):
+        response = self.export("csv", message_status__exact=ReceiptInvoice.MESSAGE_STATUS_FAILED)
+
+        rows = list(csv.reader(StringIO(b"".join(response.streaming_content).decode("utf-8"))))
+        self.assertEqual(rows[1][2], "'=cmd|' /C calc'!A0")
+        self.assertEqual(rows[1][3], "'+919999999999")
+
+    def test_xlsx(self):
+        response = self.export("xlsx")
+
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(BytesIO(b"".join(response.streaming_content))) as workbook:
+            self.assertIsNone(workbook.testzip())
+            sheet = ElementTree.fromstring(workbook.read("xl/worksheets/sheet1.xml"))
+
+        namespace = {"main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+        rows = sheet.findall("main:sheetData/main:row", namespace)
+        self.assertEqual(len(rows), 5)
+        self.assertIn("'=cmd|' /C calc'!A0", [text.text for text in rows[-2].iter("{%s}t" % namespace["main"])])
+        self.assertEqual(Decimal(rows[-1].findall("main:c/main:v", namespace)[-1].text), 220)
+
+    def test_unknown_format(self):
+        self.assertEqual(self.export("pdf").status_code, 404)
+
+    def test_receipt_deleted_while_streaming_is_skipped(self):
+        queryset = mock.Mock()
+        receipt_ids = [self.failed_receipt_invoice.pk, self.sent_receipt_invoice.pk + 1, self.sent_receipt_invoice.pk]
+        queryset.values_list.return_value.iterator.return_value = iter(receipt_ids)
+
+        self.assertEqual(
+            list(iter_receipt_invoices(queryset, chunk_size=2)),
+            [self.failed_receipt_invoice, self.sent_receipt_invoice],
+        )
+
+
+class PublicationScheduleTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("admin", first_name="Admin", last_name="User")
+        self.dates = {}
+        for client_name, name, edition, publication_dates in (
+            ("First", "Paper", "Delhi", (date(2020, 6, 1), date(2020, 6, 3))),
+            ("Second", "Paper", "Delhi", (date(2020, 6, 1),)),
+            ("Third", "Paper", "Agra", (date(2020, 6, 1),)),
+            ("Fourth", "Another Paper", "Delhi", (date(2020, 6, 1), date(2020, 6, 4))),
+        ):
+            receipt_invoice = ReceiptInvoice.objects.create(
+                created_by=user, client_name=client_name, phone_number="+919999999999", caption="Caption"
+            )
+            paper = PaperForAdvertisement.objects.create(
+                name=name, edition=edition, receipt_invoice=receipt_invoice, rate=100
+            )
+            for publication_date in publication_dates:
+                self.dates[(client_name, publication_date)] = DatesForPaperAdvertisement.objects.create(
+                    date=publication_date, paper_for_advertisement=paper
+                )
+
+    def test_grouped_by_date_then_paper_and_edition(self):
+        with self.assertNumQueries(1):
+            schedule = get_publication_schedule(date(2020, 6, 1), date(2020, 6, 3))
+            client_names = [
+                [
+                    (
+                        paper,
+                        [advt_date.paper_for_advertisement.receipt_invoice.client_name for advt_date in advertisements],
+                    )
+                    for paper, advertisements in papers
+                ]
+                for publication_date, papers in schedule
+            ]
+
+        self.assertEqual(
+            [publication_date for publication_date, papers in schedule], [date(2020, 6, 1), date(2020, 6, 3)]
+        )
+        self.assertEqual(
+            client_names,
+            [
+                [
+                    (("Another Paper", "Delhi"), ["Fourth"]),
+                    (("Paper", "Agra"), ["Third"]),
+                    (("Paper", "Delhi"), ["First", "Second"]),
+                ],
+                [(("Paper", "Delhi"), ["First"])],
+            ],
+        )
+
+    def test_end_date_is_inclusive(self):
+        schedule = get_publication_schedule(date(2020, 6, 4), date(2020, 6, 4))
+
+        self.assertEqual(
+            schedule, [(date(2020, 6, 4), [(("Another Paper", "Delhi"), [self.dates[("Fourth", date(2020, 6, 4))]])])]
+        )
+
+    def test_end_date_defaults_to_start_date(self):
+        form = PublicationScheduleForm({"start_date": "2020-06-01"})
+
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data["end_date"], date(2020, 6, 1))
+
+    def test_end_date_before_start_date(self):
+        form = PublicationScheduleForm({"start_date": "2020-06-02", "end_date": "2020-06-01"})
+
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.non_field_errors(), ["End date can not be before the start date."])
+
+    def test_range_is_limited(self):
+        start_date = date(2020, 6, 1)
+        form = PublicationScheduleForm(
+            {"start_date": start_date, "end_date": start_date + timedelta(days=PUBLICATION_SCHEDULE_MAX_DAYS + 1)}
+        )
+
+        self.assertFalse(form.is_valid())
+        self.assertEqual(
+            form.non_field_errors(),
+            ["Please select a range of at most {0} days.".format(PUBLICATION_SCHEDULE_MAX_DAYS)],
+        )
+        self.assertTrue(
+            PublicationScheduleForm(
+                {"start_date": start_date, "end_date": start_date + timedelta(days=PUBLICATION_SCHEDULE_MAX_DAYS)}
+            ).is_valid()
+        )
+
+
+class ChangedFormsOnlyTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            "admin", "admin@example.com", "password", first_name="Admin", last_name="User"
+        )
+        self.receipt_invoice = ReceiptInvoice.objects.create(
+            created_by=self.user, client_name="Client", phone_number="+919999999999", caption="Caption"
+        )
+        self.papers = []
+        self.dates = []
+        for name, publication_dates in (
+            ("Paper", (date(2020, 6, 1), date(2020, 6, 2))),
+            ("Other Paper", (date(2020, 6, 3),)),
+        ):
+            paper = PaperForAdvertisement.objects.create(
+                name=name, edition="Delhi", receipt_invoice=self.receipt_invoice, rate=100
+            )
+            self.papers.append(paper)
+            self.dates.append(
+                [
+                    DatesForPaperAdvertisement.objects.create(date=publication_date, paper_for_advertisement=paper)
+                    for publication_date in publication_dates
+                ]
+            )
+
+        self.client.force_login(self.user)
+        self.url = reverse("admin:receipt_invoice_receiptinvoice_change", args=(self.receipt_invoice.pk,))
+
+    def get_post_data(self, papers=None, dates=None, new_dates=None, **changes):
+        """
+        Builds the post of the change form the way custom_admin.js trims it, so the existing papers and dates only
+        post their id unless they are given in ``papers`` / ``dates`` as {index: {field: value}}.
+        """
+        papers, dates, new_dates = papers or {}, dates or {}, new_dates or {}
+        data = {
+            "caption": self.receipt_invoice.caption,
+            "bank_name": "",
+            "branch": "",
+            "mode_of_payment": self.receipt_invoice.mode_of_payment,
+            "version": self.receipt_invoice.version,
+            "total_papers-TOTAL_FORMS": len(self.papers),
+            "total_papers-INITIAL_FORMS": len(self.papers),
+            "total_papers-MIN_NUM_FORMS": 0,
+            "total_papers-MAX_NUM_FORMS": 1000,
+        }
+        for paper_index, paper in enumerate(self.papers):
+            prefix = "total_papers-{0}-".format(paper_index)
+            data[prefix + "id"] = paper.pk
+            for name, value in papers.get(paper_index, {}).items():
+                data[prefix + name] = value
+
+            paper_dates = self.dates[paper_index]
+            paper_new_dates = new_dates.get(paper_index, [])
+            data.update(
+                {
+                    prefix + "all_dates-TOTAL_FORMS": len(paper_dates) + len(paper_new_dates),
+                    prefix + "all_dates-INITIAL_FORMS": len(paper_dates),
+                    prefix + "all_dates-MIN_NUM_FORMS": 0,
+                    prefix + "all_dates-MAX_NUM_FORMS": 1000,
+                }
+            )
+            for date_index, advt_date in enumerate(paper_dates):
+                date_prefix = "{0}all_dates-{1}-".format(prefix, date_index)
+                data[date_prefix + "id"] = advt_date.pk
+                for name, value in dates.get((paper_index, date_index), {}).items():
+                    data[date_prefix + name] = value
+
+            for date_index, publication_date in enumerate(paper_new_dates, len(paper_dates)):
+                date_prefix = "{0}all_dates-{1}-".format(prefix, date_index)
+                data[date_prefix + "id"] = ""
+                data[date_prefix + "paper_for_advertisement"] = paper.pk
+                data[date_prefix + "date"] = publication_date
+
+        data.update(changes)
+        return data
+
+    def get_changed_date(self, paper_index, date_index, publication_date):
+        advt_date = self.dates[paper_index][date_index]
+        return {"paper_for_advertisement": advt_date.paper_for_advertisement_id, "date": publication_date}
+
+    def assertPapersNotSaved(self):
+        for paper in self.papers:
+            paper.refresh_from_db()
+            self.assertEqual(paper.version, 0)
+
+    def test_only_the_changed_date_is_saved(self):
+        data = self.get_post_data(dates={(0, 1): self.get_changed_date(0, 1, "2020-07-01")})
+
+        with mock.patch.object(
+            DatesForPaperAdvertisement, "save", autospec=True, side_effect=DatesForPaperAdvertisement.save
+        ) as save:
+            response = self.client.post(self.url, data)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual([call.args[0].pk for call in save.call_args_list], [self.dates[0][1].pk])
+        self.assertEqual(
+            sorted(DatesForPaperAdvertisement.objects.values_list("date", flat=True)),
+            [date(2020, 6, 1), date(2020, 6, 3), date(2020, 7, 1)],
+        )
+        self.assertPapersNotSaved()
+
+    def test_new_date_under_an_unchanged_paper_is_saved(self):
+        response = self.client.post(self.url, self.get_post_data(new_dates={1: ["2020-07-01"]}))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(self.papers[1].all_dates.values_list("date", flat=True)), [date(2020, 6, 3), date(2020, 7, 1)]
+        )
+        self.assertEqual(self.papers[0].all_dates.count(), 2)
+        self.assertPapersNotSaved()
+
+    def test_unchanged_forms_are_rendered_from_the_database_on_errors(self):
+        response = self.client.post(
+            self.url, self.get_post_data(caption="", dates={(0, 0): self.get_changed_date(0, 0, "2020-07-01")})
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["adminform"].form.errors)
+        self.assertContains(response, 'value="Other Paper"')
+        self.assertContains(response, 'value="2020-06-03"')
+        self.assertContains(response, 'value="2020-07-01"')
+        self.assertEqual(DatesForPaperAdvertisement.objects.filter(date=date(2020, 7, 1)).count(), 0)
+
+    def test_trimmed_delete_of_a_date(self):
+        response = self.client.post(self.url, self.get_post_data(dates={(0, 1): {"DELETE": "on"}}))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(DatesForPaperAdvertisement.objects.filter(pk=self.dates[0][1].pk).exists())
+        self.assertEqual(DatesForPaperAdvertisement.objects.count(), 2)
+
+    def test_trimmed_delete_of_a_paper(self):
+        self.dates[1].pop().delete()
+
+        response = self.client.post(self.url, self.get_post_data(papers={1: {"DELETE": "on"}}))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(PaperForAdvertisement.objects.filter(pk=self.papers[1].pk).exists())
+        self.assertTrue(PaperForAdvertisement.objects.filter(pk=self.papers[0].pk).exists())
+
+    def test_trimmed_delete_of_a_paper_with_dates_is_refused(self):
+        # The dates protect their paper, so a trimmed delete is refused just like a fully posted one instead of
+        # being dropped silently.
+        response = self.client.post(
+            self.url, self.get_post_data(papers={1: {"DELETE": "on"}}, dates={(1, 0): {"DELETE": "on"}})
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            "would require deleting the following protected related objects",
+            str(response.context["inline_admin_formsets"][0].formset.non_form_errors()),
+        )
+        self.assertTrue(PaperForAdvertisement.objects.filter(pk=self.papers[1].pk).exists())
+        self.assertEqual(DatesForPaperAdvertisement.objects.count(), 3)
@@ -0,0 +1,5 @@
+def get_amount_in_words(amount):
+    # num2words loads its whole language table on import, so it is only imported once an amount is rendered.
+    from num2words import num2words
+
+    return num2words(amount).title()
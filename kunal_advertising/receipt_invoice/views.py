@@ -1,18 +1,14 @@
-from django.core.cache import cache
-from rest_framework import status
+from http import HTTPStatus
+
 from django.http import HttpResponseNotFound, JsonResponse, HttpResponseRedirect
 from django.shortcuts import render
 
 # Create your views here.
 from django.views.generic import TemplateView, View
 
-from kunal_advertising.receipt_invoice.models import ReceiptInvoice
-from kunal_advertising.receipt_invoice.constants import (
-    NO_PAPER_FOUND,
-    NO_DATE_FOUND,
-    CACHE_KEY_FOR_TOTAL_AMOUNT,
-    CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS,
-)
+from kunal_advertising.receipt_invoice.archive import load_archived_receipt_invoice
+from kunal_advertising.receipt_invoice.models import ReceiptInvoice, ArchivedReceiptInvoice
+from kunal_advertising.receipt_invoice.constants import NO_PAPER_FOUND, NO_DATE_FOUND
 
 
 class RedirectToAdminView(View):
@@ -27,30 +23,30 @@ class ReceiptInvoicePreview(TemplateView):
         try:
             receipt_id = request.GET.get("receipt_id") or int(args[0])
             receipt_invoice = ReceiptInvoice.objects.get(pk=receipt_id)
-        except (ValueError, ReceiptInvoice.DoesNotExist):
+        except ValueError:
             return HttpResponseNotFound()
+        except ReceiptInvoice.DoesNotExist:
+            return self.render_archived_receipt_invoice(request, receipt_id, **kwargs)
 
         if not receipt_invoice.total_papers.all():
             return JsonResponse(
                 {"No paper Found": NO_PAPER_FOUND.format(client_name=receipt_invoice.client_name)},
-                status=status.HTTP_400_BAD_REQUEST,
+                status=HTTPStatus.BAD_REQUEST,
             )
         else:
             for paper in receipt_invoice.total_papers.all():
                 if not paper.all_dates.all():
                     return JsonResponse(
                         {"No dates found": NO_DATE_FOUND.format(paper_name=paper.name)},
-                        status=status.HTTP_400_BAD_REQUEST,
+                        status=HTTPStatus.BAD_REQUEST,
                     )
         context = self.get_context_data(**kwargs)
         context["receipt_invoice"] = receipt_invoice
 
-        cache_key_for_total_amount = CACHE_KEY_FOR_TOTAL_AMOUNT.format(client_id=receipt_invoice.id)
-        cache_key_for_total_amount_in_words = CACHE_KEY_FOR_TOTAL_AMOUNT_IN_WORDS.format(client_id=receipt_invoice.id)
-        context["total_amount_charged"] = cache.get(cache_key_for_total_amount)
-        context["total_amount_charged_in_words"] = cache.get(cache_key_for_total_amount_in_words)
+        context["total_amount_charged"] = receipt_invoice.get_total_amount_charged()
+        context["total_amount_charged_in_words"] = receipt_invoice.get_total_amount_charged_in_words()
 
-        if not receipt_invoice.message_sent:
+        if receipt_invoice.message_status != ReceiptInvoice.MESSAGE_STATUS_SENT:
             receipt_invoice.send_message_for_bill_receipt_created(context["total_amount_charged"])
 
         return render(
@@ -58,5 +54,25 @@ class ReceiptInvoicePreview(TemplateView):
             template_name=ReceiptInvoicePreview.template_name,
             context=context,
             content_type="text/html",
-            status=status.HTTP_200_OK,
+            status=HTTPStatus.OK,
+        )
+
+    def render_archived_receipt_invoice(self, request, receipt_id, **kwargs):
+        try:
+            archived_receipt_invoice = ArchivedReceiptInvoice.objects.get(receipt_id=receipt_id)
+        except ArchivedReceiptInvoice.DoesNotExist:
+            return HttpResponseNotFound()
+
+        receipt_invoice = load_archived_receipt_invoice(archived_receipt_invoice)
+        context = self.get_context_data(**kwargs)
+        context["receipt_invoice"] = receipt_invoice
+        context["total_amount_charged"] = receipt_invoice.total_amount_charged
+        context["total_amount_charged_in_words"] = receipt_invoice.total_amount_charged_in_words
+
+        return render(
+            request,
+            template_name=ReceiptInvoicePreview.template_name,
+            context=context,
+            content_type="text/html",
+            status=HTTPStatus.OK,
         )
@@ -0,0 +1,68 @@
+"""
+Pre-fork warmup for the WSGI application.
+
+uwsgi loads the application in the master process and forks the workers from it (unless ``lazy-apps`` is
+enabled), so whatever is loaded here is shared by every worker and their first request is served at steady state
+latency instead of paying for URL resolution, template compilation and content type lookups.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+WARMUP_TEMPLATES = (
+    "admin/index.html",
+    "admin/change_list.html",
+    "admin/change_form.html",
+    "admin/receipt_invoice/receiptinvoice/change_list.html",
+    "admin/receipt_invoice/receiptinvoice/publication_schedule.html",
+    "create_pdf_invoice.html",
+)
+
+
+def warm_urls():
+    from django.urls import get_resolver
+
+    # Accessing the reverse dict imports every urlconf, which also builds the admin urls of all registered models.
+    get_resolver().reverse_dict
+
+
+def warm_templates():
+    from django.template import TemplateDoesNotExist
+    from django.template.loader import get_template
+
+    for template_name in WARMUP_TEMPLATES:
+        try:
+            get_template(template_name)
+        except TemplateDoesNotExist:
+            logger.warning("Template {0} could not be warmed up".format(template_name))
+
+
+def warm_content_types():
+    from django.apps import apps
+    from django.contrib.contenttypes.models import ContentType
+
+    ContentType.objects.get_for_models(*apps.get_models())
+
+
+WARMUP_STEPS = (warm_urls, warm_templates, warm_content_types)
+
+
+def warmup():
+    """
+    Runs every warmup step. The warmup is only an optimisation, so a failing step (e.g. the database not being
+    reachable yet) is logged and skipped instead of keeping the application from loading.
+    """
+    from django.db import connections
+
+    try:
+        for step in WARMUP_STEPS:
+            try:
+                step()
+            except Exception:
+                logger.warning("Warmup step {0} failed, skipping it".format(step.__name__), exc_info=True)
+    finally:
+        # Connections must not be shared with the forked workers.
+        connections.close_all()
+
+    logger.info("Warmup done")
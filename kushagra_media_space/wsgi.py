@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "kushagra_media_space.settings")
 
 application = get_wsgi_application()
+
+if os.environ.get("DJANGO_WARMUP_ON_BOOT"):
+    from kushagra_media_space.warmup import warmup
+
+    warmup()
@@ -1,3 +1,60 @@
 window.onload = function() {
-    document.getElementById("searchbar").placeholder = "Search for Client Name";
-};
\ No newline at end of file
+    var searchBar = document.getElementById("searchbar");
+    if (searchBar) {
+        searchBar.placeholder = "Search for Client Name";
+    }
+
+    var changeForm = document.getElementById("receiptinvoice_form");
+    if (changeForm) {
+        changeForm.addEventListener("submit", skipUnchangedInlineForms);
+    }
+};
+
+window.addEventListener("pageshow", function() {
+    // Coming back to the page from the browser history must not leave the skipped fields disabled.
+    var skippedFields = document.querySelectorAll("[data-skipped-unchanged]");
+    Array.prototype.forEach.call(skippedFields, function(field) {
+        field.disabled = false;
+        field.removeAttribute("data-skipped-unchanged");
+    });
+});
+
+function isFieldChanged(field) {
+    if (field.type === "checkbox" || field.type === "radio") {
+        return field.checked !== field.defaultChecked;
+    }
+
+    if (field.tagName === "SELECT") {
+        return Array.prototype.some.call(field.options, function(option) {
+            return option.selected !== option.defaultSelected;
+        });
+    }
+
+    return field.value !== field.defaultValue;
+}
+
+// Existing inline forms the user did not touch only post their id. The server fills in the rest from the database
+// and neither validates nor saves them. Nested inline forms are checked on their own, as their fields are named
+// "<form prefix>-<inline prefix>-<index>-<field>" while the fields of the form itself are "<form prefix>-<field>".
+function skipUnchangedInlineForms() {
+    var changeForm = this;
+    var inlineForms = document.querySelectorAll(".djn-inline-form.has_original");
+
+    Array.prototype.forEach.call(inlineForms, function(inlineForm) {
+        var prefix = inlineForm.id + "-";
+        var fields = Array.prototype.filter.call(changeForm.elements, function(field) {
+            return field.name && field.name.indexOf(prefix) === 0 && field.name.slice(prefix.length).indexOf("-") === -1;
+        });
+
+        if (fields.some(isFieldChanged)) {
+            return;
+        }
+
+        fields.forEach(function(field) {
+            if (field.name !== prefix + "id" && !field.disabled) {
+                field.disabled = true;
+                field.setAttribute("data-skipped-unchanged", "");
+            }
+        });
+    });
+}